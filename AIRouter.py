@@ -5,11 +5,18 @@
 # -----------------------------------------------------
 
 # Dependencies
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np      # Installation: pip3 install numpy==1.14.3
+import HttpClient
 from TextAnalytics import TextAnalytics
 from CRM import CRM
 from Agents import Agents
 from RankingNetwork import RankingNetwork
+from RoutingQueue import RoutingQueue
+from CandidateGenerators import ExactCandidateGenerator
+import Assignment
 
 
 class AIRouter(object):
@@ -19,59 +26,80 @@ class AIRouter(object):
         2. Ranking (ranks the candidates in order to choose the best one for the interaction)
     """
 
-    def __init__(self, crm, agents):
+    def __init__(self, crm, agents, inference_only=True):
         # Text analytics will be used to detect language, sentiment and intent in user input.
         self.text_analytics = TextAnalytics()
 
+        # Sentiment and intent are requested at the same time (see analyze_question).
+        # If an API takes longer than analysis_timeout seconds, a default value is used.
+        # API calls are not retried and time out after analysis_timeout seconds too:
+        # a late answer is not used, so it would only keep a thread of the pool busy.
+        self.analysis_executor = ThreadPoolExecutor(max_workers=8)
+        self.analysis_timeout = 5.0
+        self.text_analytics.http_options = {"timeout": (HttpClient.connect_timeout, self.analysis_timeout), "retries": 0}
+
         self.crm = crm
         self.agents = agents
-        self.ranking_network = RankingNetwork(self.crm, self.agents)
+        self.ranking_network = RankingNetwork(self.crm, self.agents, inference_only)
 
         # Determines the maximum number of candidates for ranking
         self.max_number_of_candidates = 3
 
+        # Selects the candidates: every available agent is scored by default.
+        # For large contact centers an approximate generator (ex:
+        # CandidateGenerators.IVFCandidateGenerator) trades some recall for
+        # speed; see benchmark_candidates.py for the recall and latency of
+        # every max_number_of_candidates and nprobe.
+        self.candidate_generator = ExactCandidateGenerator(self.agents)
+
+        # Interactions with no available agent wait here, and are given to
+        # the first suitable agent that is free again (see on_agent_available).
+        # on_interaction_assigned(data, reply) is called when that happens,
+        # with the 'reply_to' given to route_to_best_agent. If it raises, the
+        # interaction goes back to its place in the queue.
+        # If use_routing_queue is False, the customer is asked to try again later.
+        self.routing_queue = RoutingQueue(self.agents)
+        self.use_routing_queue = True
+        self.on_interaction_assigned = None
+        self.agents.states.add_listener(self.on_agent_available)
+
+        # Chats given to agents only count against their capacity if reserve_chats
+        # is set. Set it when the contact center reports the end of every chat
+        # (see AgentStates.end_chat): otherwise the agents would never be free again.
+        self.reserve_chats = False
+
+        # Batch routing (see start_batch_routing): under heavy load the waiting
+        # interactions are assigned together every batch_routing_interval seconds.
+        # A tick scores and assigns at most batch_routing_max_pairs (interactions x
+        # available agents), the highest priority interactions first; the others wait
+        # for the next tick. 250 interactions x 1000 agents take about 0.4s with scipy
+        # and 0.7s with the auction fallback, see benchmark_batch_routing.py.
+        # 1000 x 1000 does not fit in a tick of 1s: it takes 2.3-2.7s with scipy
+        # (6-11s with the auction). Scoring the 1M pairs alone takes 0.7-0.9s, and
+        # the assignment is slow to solve because the predicted scores are almost
+        # the sum of a contact term and an agent term (ids are raw inputs of the
+        # network): many assignments are nearly as good, and the solvers take long
+        # to tell them apart. Scoring only the top candidates of every interaction
+        # does not help either: with these scores all the interactions have the
+        # same top agents, and most of them would get none.
+        self.batch_routing_interval = None
+        self.batch_routing_max_pairs = 250000
+        self.batch_routing_thread = None
+
 
     def generate_candidates(self, language, intent, verbose=False):
         """ Returns a list with a number of candidates (yet to be ranked).
             Candidates are selected according to their skills for handling
             the language and intent of the interaction.
         """
-        candidates = []
-
-        en_weight = 0.0
-        es_weight = 0.0
-        sales_weight = 0.0
-        support_weight = 0.0
-
-        if language=="en":
-            en_weight = 1.0  # English skill needed
-        elif language=="es":
-            es_weight = 1.0  # Spanish skill needed
-
-        if intent=="sales":
-            sales_weight = 1.0      # Sales skill needed
-        elif intent=="support":
-            support_weight = 1.0    # Support skill needed
-
-        for agent in self.agents.agents:
-            skill_for_the_job = \
-                en_weight * agent["en"] + \
-                es_weight * agent["es"] + \
-                sales_weight * agent["sales"] + \
-                support_weight * agent["support"]        
-            # In a real case we may want to filter here the unavailable agents
-            # (not logged, not ready to work or already busy)
-            # or the ones that do not verify some minimum skills
-            # In this example we filter only those who have absolutely
-            # no skills for the job.
-            if skill_for_the_job > 0.:
-                candidates.append((agent["agent id"], skill_for_the_job))
-         
-        # Sort by 'skill_for_the_job' column
-        candidates = sorted(candidates, key=lambda entry: entry[1], reverse=True)   
-
-        # We want the first N only
-        candidates = candidates[:self.max_number_of_candidates]
+        # Weighted skill sum: weight 1 for the skills needed by the interaction
+        # (language and intent), 0 for the others.
+        # Only the available agents (logged, ready to work and not at their
+        # maximum number of chats) with some skill for the job are scored.
+        # In a real case we may also want to filter the ones that do not
+        # verify some minimum skills.
+        # The generator returns the first N only, sorted by 'skill_for_the_job'.
+        candidates = self.candidate_generator.generate(language, intent, self.max_number_of_candidates)
 
         if verbose:
             if len(candidates) == 0:
@@ -85,6 +113,16 @@ class AIRouter(object):
         return [row[0] for row in candidates]        
 
 
+    def generate_candidates_batch(self, interactions):
+        """ Same as generate_candidates for a batch of queued interactions.
+            'interactions' is a list of (language, intent) pairs (with the exact
+            generator, all of them are scored in a single matrix product).
+            Returns one list of agent ids per interaction.
+        """
+        batch = self.candidate_generator.generate_batch(interactions, self.max_number_of_candidates)
+        return [[row[0] for row in candidates] for candidates in batch]
+
+
     def rank_candidates(self, contact_id, language, sentiment, intent, candidates):
         """ Ranks a list of candidates. 
             Rank is calculated according to customer, agent and interaction features.
@@ -100,29 +138,69 @@ class AIRouter(object):
         return sorted(ranked_candidates, key=lambda entry: entry[1], reverse=True)
 
 
-    def route_to_best_agent(self, contact_id, question):
+    def get_analysis_result(self, future, deadline, default, name):
+        """ Waits for an analysis call until the deadline. Returns 'default' on timeout or error.
+        """
+        try:
+            return future.result(timeout=max(0.0, deadline - time.time()))
+        except Exception as e:
+            # Calls still waiting for a thread are dropped
+            future.cancel()
+            print("No {0} for the question ({1}), using '{2}'".format(name, type(e).__name__, default))
+            return default
+
+
+    def analyze_question(self, question, language=None):
+        """ Guesses the language, sentiment and intent of a question.
+            Sentiment and intent only depend on the language, so they are requested
+            concurrently. If the language is already known (ex: from the conversation
+            context), the analysis takes a single round trip to the APIs.
+            Returns (language, sentiment, intent); the intent is None if it could
+            not be found in time (unlike "other", when the question was not understood).
+        """
+        deadline = time.time() + self.analysis_timeout
+
+        if language is None:
+            # Take a guess at the language
+            future = self.analysis_executor.submit(self.text_analytics.guess_language, question, True)
+            language = self.get_analysis_result(future, deadline, "en", "language")
+
+        # Take a guess at the sentiment and the intent at the same time
+        sentiment_future = self.analysis_executor.submit(self.text_analytics.guess_sentiment, question, language, False)
+        intent_future = self.analysis_executor.submit(self.text_analytics.guess_intent, question, language, True)
+
+        sentiment = self.get_analysis_result(sentiment_future, deadline, 0.5, "sentiment")
+        intent = self.get_analysis_result(intent_future, deadline, None, "intent")
+
+        return language, sentiment, intent
+
+
+    def route_to_best_agent(self, contact_id, question, language=None, reply_to=None):
         """ Routes the interaction to the best available agent.
             Because this is just a sample we'll not route anything,
             we'll just return a reply saying which agent was selected
             or a default message if no agent could be chosen.
+            In that case the interaction waits in the routing queue
+            until an agent is free ('reply_to' is kept with it).
+            If the language of the conversation is known it is not guessed again.
         """
 
         # Get the contact from the CRM
         contact = self.crm.get_contact_by_id(contact_id)
 
-        # Take a guess at the language
-        language = self.text_analytics.guess_language(question, verbose=True)
-
-        # Take a guess at the sentiment
-        sentiment = self.text_analytics.guess_sentiment(question, language, verbose=False)
-
-        # Take a guess at the intent
-        intent = self.text_analytics.guess_intent(question, language, verbose=True)
+        # Take a guess at the language, sentiment and intent
+        language, sentiment, intent = self.analyze_question(question, language)
 
         print("Received question from {0}: '{1}'".format(contact["name"], question))
         print("Language={0}, Sentiment={1}, Intent={2}".format(language, sentiment, intent))
 
-        if intent == "other":
+        if intent is None:
+            # The APIs failed or were too slow: the question may be fine, ask to try again
+            if language == "es":
+                return "Perdona {}, no podemos atender tu pregunta en este momento. Por favor, inténtalo de nuevo en unos minutos.".format(contact["name"])
+            else:
+                return "Sorry {}, we can't handle your question right now. Please try again in a few minutes.".format(contact["name"])
+        elif intent == "other":
             # Intent was not discovered... return a default message in the proper language
             if language == "es":
                 return "Perdona {}, pero no te entiendo...".format(contact["name"])
@@ -134,10 +212,7 @@ class AIRouter(object):
 
             if len(candidates) == 0:
                 # No candidates case
-                if language=="es":
-                    return "Todos los agentes humanos están ocupados en este momento. Por favor espera, tu pregunta será respondida lo más rápido posible."
-                else:
-                    return "All human agents are busy at this moment. Please wait, your question will be answered as soon as possible."
+                return self.park_interaction(contact_id, language, sentiment, intent, reply_to)
             else:
                 print("Candidates found: predicting success")
 
@@ -148,22 +223,181 @@ class AIRouter(object):
                 for ranked_candidate in ranked_candidates:
                     print("{0} (predicted success = {1})".format(self.agents.get_agent_name(ranked_candidate[0]), ranked_candidate[1]))
 
-                # Choose the best one
-                best_agent = ranked_candidates[0]
-                
-                ret = ""
+                # Choose the best one that is still available
+                best_agent = None
+                for ranked_candidate in ranked_candidates:
+                    if self.take_agent(ranked_candidate[0]):
+                        best_agent = ranked_candidate
+                        break
+
+                if best_agent is None:
+                    return self.park_interaction(contact_id, language, sentiment, intent, reply_to)
+
+                return self.get_transfer_message(language, intent, best_agent[0])
+
 
-                if language=="es":
-                    if intent=="sales":
-                        department = "ventas"
-                    else:
-                        department = "soporte"
-                    ret = "Transfiriendo a {0}, del departamento de {1}. ¡Encantado de hablar contigo!".format(self.agents.get_agent_name(best_agent[0]), department)
-                else:
-                    return "Directing to {0}, from {1} department. Nice talking to you!".format(self.agents.get_agent_name(best_agent[0]), intent)
+    def take_agent(self, agent_id):
+        """ Gives an interaction to an agent, if it is still available (another
+            interaction may have taken its last free chat meanwhile). The chat is
+            counted against the capacity of the agent if reserve_chats is set.
+            Returns False if the agent is not available.
+        """
+        if self.reserve_chats:
+            return self.agents.states.start_chat(agent_id)
+        return self.agents.states.is_available(agent_id)
 
-                return ret
 
+    def get_transfer_message(self, language, intent, agent_id):
+        """ Reply telling the customer which agent will handle the interaction.
+        """
+        if language=="es":
+            if intent=="sales":
+                department = "ventas"
+            else:
+                department = "soporte"
+            return "Transfiriendo a {0}, del departamento de {1}. ¡Encantado de hablar contigo!".format(self.agents.get_agent_name(agent_id), department)
+        else:
+            return "Directing to {0}, from {1} department. Nice talking to you!".format(self.agents.get_agent_name(agent_id), intent)
+
+
+    def park_interaction(self, contact_id, language, sentiment, intent, reply_to):
+        """ Puts an interaction in the routing queue and returns the reply for the customer.
+            A contact that is already waiting keeps a single place in the queue.
+        """
+        if not self.use_routing_queue:
+            print("No agent available")
+            return self.get_retry_message(language)
 
-    def train(self):
-        self.ranking_network.train(500)
+        if self.routing_queue.enqueue(contact_id, language, sentiment, intent, reply_to) is None:
+            print("No agent available and the routing queue is full")
+            return self.get_retry_message(language)
+
+        print("No agent available: interaction queued ({} waiting)".format(len(self.routing_queue)))
+
+        if language=="es":
+            return "Todos los agentes humanos están ocupados en este momento. Por favor espera, tu pregunta será respondida lo más rápido posible."
+        else:
+            return "All human agents are busy at this moment. Please wait, your question will be answered as soon as possible."
+
+
+    def get_retry_message(self, language):
+        """ Reply asking the customer to ask again later.
+        """
+        if language=="es":
+            return "Todos los agentes humanos están ocupados en este momento. Por favor, vuelve a intentarlo más tarde."
+        else:
+            return "All human agents are busy at this moment. Please try again later."
+
+
+    def on_agent_available(self, agent_id):
+        """ Gives an agent that is free again the waiting interactions with the highest priority.
+            In batch routing mode nothing is done: the next batch will use the agent.
+        """
+        if self.batch_routing_interval is None:
+            self.routing_queue.assign(agent_id, self.on_queued_interaction_assigned, self.reserve_chats)
+
+
+    def assign_batch(self, interactions, use_scipy=True):
+        """ Assigns many interactions at once to the available agents, maximizing the
+            total predicted success instead of giving each interaction its own best agent
+            (which piles interactions on the strongest agents while others are idle).
+            'interactions' is a list of (contact id, language, sentiment, intent).
+            An agent takes at most its free chats, and only interactions it has some
+            skill for (as in generate_candidates). The agents are not reserved here.
+            Returns the agent id for every interaction (None: no agent).
+        """
+        if len(interactions) == 0:
+            return []
+        contact_ids, languages, sentiments, intents = [list(column) for column in zip(*interactions)]
+
+        # Available agents with some skill for any of the interactions
+        rows = self.agents.states.get_available_rows(set(languages) | set(intents))
+        agent_ids = self.agents.skill_index.agent_ids[rows]
+        capacities = self.agents.states.get_free_chats(agent_ids)
+
+        weights = self.agents.skill_index.query_matrix(list(zip(languages, intents)))
+        allowed = np.dot(weights, self.agents.skill_index.skills[rows].T) > 0.
+
+        # Success of every agent for every interaction, in one pass of the network
+        scores = self.ranking_network.predict_matrix(contact_ids, languages, sentiments, intents, agent_ids)
+
+        columns = Assignment.assign(scores, capacities, allowed, use_scipy=use_scipy)
+        return [int(agent_ids[column]) if column >= 0 else None for column in columns]
+
+
+    def route_waiting_interactions(self):
+        """ Assigns the waiting interactions in one batch (see assign_batch), at most
+            batch_routing_max_pairs / available agents of them.
+            Interactions that get no agent keep their place in the queue.
+            Returns the number of interactions assigned.
+        """
+        number_of_agents = int(np.sum(self.agents.states.get_available_mask()))
+        if number_of_agents == 0:
+            return 0
+
+        interactions = self.routing_queue.pop_all(max(1, self.batch_routing_max_pairs // number_of_agents))
+        if len(interactions) == 0:
+            return 0
+
+        agent_ids = self.assign_batch([(interaction.contact_id, interaction.language, interaction.sentiment,
+                                        interaction.intent) for interaction in interactions])
+        assigned = 0
+        for interaction, agent_id in zip(interactions, agent_ids):
+            # The agent may have changed state since the batch was computed
+            if not agent_id is None and self.take_agent(agent_id):
+                try:
+                    self.on_queued_interaction_assigned(interaction, agent_id)
+                    assigned += 1
+                except Exception as e:
+                    print("Error assigning the interaction of contact {0}: {1}".format(interaction.contact_id, e))
+                    self.routing_queue.unassign(interaction, agent_id, self.reserve_chats)
+            else:
+                self.routing_queue.requeue(interaction)
+        return assigned
+
+
+    def start_batch_routing(self, interval=1.0):
+        """ Switches to batch routing: every 'interval' seconds, the waiting interactions
+            are assigned together (see route_waiting_interactions), instead of one by one
+            as agents are free.
+        """
+        self.batch_routing_interval = interval
+        if self.batch_routing_thread is None:
+            self.batch_routing_thread = threading.Thread(target=self.run_batch_routing, name="BatchRouting")
+            self.batch_routing_thread.daemon = True
+            self.batch_routing_thread.start()
+
+
+    def run_batch_routing(self):
+        while not self.batch_routing_interval is None:
+            start = time.time()
+            try:
+                assigned = self.route_waiting_interactions()
+                if assigned > 0:
+                    print("Batch routing: {0} interactions assigned in {1:.3f}s".format(assigned, time.time() - start))
+            except Exception as e:
+                print("Error in batch routing: {}".format(e))
+            time.sleep(max(0.0, self.batch_routing_interval - (time.time() - start)))
+
+
+    def on_queued_interaction_assigned(self, interaction, agent_id):
+        """ Tells the customer of a queued interaction which agent got it. Errors (ex: the
+            message could not be sent) are raised to the caller, which puts the
+            interaction back in the queue (see RoutingQueue.unassign).
+        """
+        print("Queued interaction of contact {0} assigned to {1} after {2:.1f}s".format(
+            interaction.contact_id, self.agents.get_agent_name(agent_id),
+            self.routing_queue.clock() - interaction.arrival_time))
+        if not self.on_interaction_assigned is None:
+            self.on_interaction_assigned(
+                interaction.data, self.get_transfer_message(interaction.language, interaction.intent, agent_id))
+
+
+    def train(self, history_file=None):
+        """ Trains the ranking network with the CRM history or,
+            if given, with the history stored in a file (streamed in chunks).
+        """
+        if history_file is None:
+            self.ranking_network.train(500)
+        else:
+            self.ranking_network.train_from_file(history_file, 500)
@@ -10,15 +10,21 @@
 
 
 # Dependencies
+import os
 import sys
+import hmac
 import random
+import threading
 from flask import Flask, request    # Installation: pip3 install Flask==1.0
-import requests                     # Installation: pip3 install requests==2.18.4
+import HttpClient                   # Shared HTTP client (connection pooling, timeouts and retries)
 from pprint import pprint
 from TextAnalytics import TextAnalytics
-from AIRouter import AIRouter
 from CRM import CRM
 from Agents import Agents
+from AgentStates import state_names as agent_state_names
+from MessageWorkers import MessageWorkers
+from ContextStore import MemoryContextStore, SQLiteContextStore
+from ContextStore import waiting_for_greeting, waiting_for_contact_id, waiting_for_question
 
 
 # We start by creating our bot endpoint.
@@ -37,57 +43,86 @@ ACCESS_TOKEN = 'Your access token'
 # when you define the webhook for this bot.
 VERIFY_TOKEN = 'AIRoutingBotToken'
 
+# Token shared with the contact center: its agent events (see /agents/events)
+# must send it in the X-Agent-Events-Token header, so nobody else can mark
+# agents as ready or busy.
+AGENT_EVENTS_TOKEN = 'Your agent events token'
+
 
 # Our bot will not have complex flows with a real authentication phase...
-# For the sake of simplicity, the conversation will have 3 stages only,
-# one to start a conversation, one for asking the contact id and 
-# a last one to receive the question from the user.
-waiting_for_greeting = 0
-waiting_for_contact_id = 1
-waiting_for_question = 2
+# The conversation stages (waiting_for_greeting, waiting_for_contact_id and
+# waiting_for_question) and the conversation context are defined in ContextStore.
 
 
 # Text analytics will be used to detect the language of the user input.
 text_analytics = TextAnalytics()
 
 
-class ConversationContext(object):
-    """ 
-        Here we'll keep the contact id from the user
-        (if contact_id >= 0, the user is registered in our CRM)
-        and the conversation stage.
-    """
-
-    def __init__(self):
-        self.reset()
-
-    def reset(self):        
-        self.contact_id = -1
-        self.language = "en"        
-        self.conversation_stage = waiting_for_greeting
-
-
 # Here we'll keep the connections context. 
 # Each connection is an association between a FB recipient id (the user)
-# and a conversation context.
-connections_context = {}
+# and a conversation context. Idle conversations expire after an hour.
+# Set context_store_file to keep them in a SQLite file instead of in memory,
+# so that several processes of the bot can serve the same conversations.
+context_store_file = None
+if context_store_file is None:
+    context_store = MemoryContextStore(ttl=3600, max_size=100000)
+else:
+    context_store = SQLiteContextStore(context_store_file, ttl=3600)
 
 
 def get_connection_context(recipient_id):
-    global connections_context
-    if recipient_id in connections_context:
-        return connections_context[recipient_id]
-    else:
-        connections_context[recipient_id] = ConversationContext()
-        return connections_context[recipient_id]
+    return context_store.get(recipient_id)
 
 
 # Let's create our small "CRM" and our agents
 crm = CRM()
 agents = Agents()
 
-# Let's create a AIRouter object to handle the routing part
-router = AIRouter(crm, agents)
+# The AIRouter object handles the routing part.
+# Creating it imports the ML stack and loads the ranking model, which is slow,
+# so it is done lazily: in a background warm-up thread started with the bot
+# or on the first question, whichever comes first. The greeting and
+# contact id stages do not need it and are served immediately.
+router = None
+router_ready = threading.Event()
+router_lock = threading.Lock()
+
+# Agent states and the routing queue are kept in the memory of the process.
+# With "-prefork" every worker process would have its own copy: a worker would
+# only see the agent events it receives and would give out the full capacity
+# of every agent, and an interaction waiting in one worker would only be served
+# if an agent event reached that worker. So they are disabled in that mode.
+agent_states_enabled = True
+
+
+def get_router():
+    """ Returns the AIRouter, creating it if it is not ready yet.
+    """
+    global router
+    if not router_ready.is_set():
+        with router_lock:
+            if router is None:
+                # Imported here so that importing this module stays fast
+                from AIRouter import AIRouter
+                router = AIRouter(crm, agents)
+                # Interactions that waited for a free agent: tell the customer who got them
+                router.on_interaction_assigned = send_message
+                if not agent_states_enabled:
+                    router.use_routing_queue = False
+                    router.reserve_chats = False
+                router_ready.set()
+    return router
+
+
+def start_router_warm_up():
+    """ Creates the AIRouter in a background thread.
+        router_ready is set when it is done.
+    """
+    thread = threading.Thread(target=get_router, name="RouterWarmUp")
+    thread.daemon = True
+    thread.start()
+    return thread
+
 
 # We will receive messages that Facebook Messenger sends to our bot at this endpoint
 @app.route('/', methods=['GET', 'POST'])
@@ -106,6 +141,7 @@ def handle_user_input():
         else:
             # Get whatever message a user sent the bot
            output = request.get_json()
+           messages = []
            for event in output['entry']:
               messaging = event['messaging']
               for message in messaging:
@@ -117,60 +153,134 @@ def handle_user_input():
                                        
                     if text:
                         print("User {0} sent '{1}'".format(recipient_id, text))
+                        messages.append((recipient_id, text))
 
-                        # Get the context of this interaction
-                        context = get_connection_context(recipient_id)
-                        
-                        # React according to the conversation stage                                               
-                        if context.conversation_stage == waiting_for_greeting:                            
-                            # Detect language
-                            context.language = text_analytics.guess_language(text, verbose=False)                            
-                            
-                            if context.language=='es':
-                                # Start by asking the contact id
-                                send_message(recipient_id, "¡Bienvenido a Appliances of the Future! Usted está hablando con un chatbot. ¿Cuál es tu número de cliente?") 
-                            else:
-                                # Any language that is not spanish will default to english
-                                context.language=='en'
-                                # Start by asking the contact id
-                                send_message(recipient_id, "Welcome to Appliances of the Future! You're talking to a chatbot. What is your customer number?") 
-                            
-                            context.conversation_stage = waiting_for_contact_id
-                        elif context.conversation_stage == waiting_for_contact_id:
-                            # Does the input contain the customer id?
-                            id = get_number_from_text(text)                            
-                            if id >= 0:
-                                contact = crm.get_contact_by_id(id)
-                                if not contact is None:
-                                    # Contact identified, let's keep it and move on
-                                    context.contact_id = id
-                                    if context.language=='es':
-                                        send_message(recipient_id, "Ola {}, ¿como puedo ayudarte? Por favor haz tu pregunta.".format(contact["name"]))                                         
-                                    else:
-                                        send_message(recipient_id, "Hi {}, how can I help you? Please state your question.".format(contact["name"])) 
-                                    context.conversation_stage = waiting_for_question
-                                else:
-                                    if context.language=='es':
-                                        send_message(recipient_id, "Lo siento, no estás registrado en el sistema. Por favor, registrate primero.")                                        
-                                    else:
-                                        send_message(recipient_id, "I'm sorry, you're not registered in the system. Please sign up first.")
-                                    context.conversation_stage = waiting_for_greeting
-                            else:
-                                if context.language=='es':
-                                    send_message(recipient_id, "Por favor ingrese un número valido...")
-                                else:
-                                    send_message(recipient_id, "Please enter a valid number...")
-                        else:
-                            # Handle the user question now, routing it to the best agent                            
-                            response_text = router.route_to_best_agent(context.contact_id, text)
-                            send_message(recipient_id, response_text)
-                            # Done with this contact - reset flow                            
-                            context.conversation_stage = waiting_for_greeting
+           # Handled in the background (see handle_message). The whole batch is
+           # queued or none of it, since Facebook sends all of it again on errors.
+           if not message_workers.submit_batch(messages):
+               # Too many messages waiting: Facebook will send them again later
+               return "Too many messages, retry later", 503
 
     except Exception as e:
         print("Error handling user input: {}".format(e))
 
-    return "Message processed"
+    return "Message received"
+
+
+def handle_message(recipient_id, text):
+    """ Reacts to a message from a user, according to the conversation stage.
+        Runs in a worker thread (see message_workers).
+    """
+    context = get_connection_context(recipient_id)
+    try:
+        handle_message_in_context(recipient_id, text, context)
+    finally:
+        # Keep the changes (needed when contexts are not kept in memory)
+        context_store.save(recipient_id, context)
+
+
+def handle_message_in_context(recipient_id, text, context):
+    """ Reacts to a message according to the conversation stage, updating the context.
+    """
+    # React according to the conversation stage                                               
+    if context.conversation_stage == waiting_for_greeting:                            
+        # Detect language
+        context.language = text_analytics.guess_language(text, verbose=False)                            
+        
+        if context.language=='es':
+            # Start by asking the contact id
+            send_message(recipient_id, "¡Bienvenido a Appliances of the Future! Usted está hablando con un chatbot. ¿Cuál es tu número de cliente?") 
+        else:
+            # Any language that is not spanish will default to english
+            context.language=='en'
+            # Start by asking the contact id
+            send_message(recipient_id, "Welcome to Appliances of the Future! You're talking to a chatbot. What is your customer number?") 
+        
+        context.conversation_stage = waiting_for_contact_id
+    elif context.conversation_stage == waiting_for_contact_id:
+        # Does the input contain the customer id?
+        id = get_number_from_text(text)                            
+        if id >= 0:
+            contact = crm.get_contact_by_id(id)
+            if not contact is None:
+                # Contact identified, let's keep it and move on
+                context.contact_id = id
+                if context.language=='es':
+                    send_message(recipient_id, "Ola {}, ¿como puedo ayudarte? Por favor haz tu pregunta.".format(contact["name"]))                                         
+                else:
+                    send_message(recipient_id, "Hi {}, how can I help you? Please state your question.".format(contact["name"])) 
+                context.conversation_stage = waiting_for_question
+            else:
+                if context.language=='es':
+                    send_message(recipient_id, "Lo siento, no estás registrado en el sistema. Por favor, registrate primero.")                                        
+                else:
+                    send_message(recipient_id, "I'm sorry, you're not registered in the system. Please sign up first.")
+                context.conversation_stage = waiting_for_greeting
+        else:
+            if context.language=='es':
+                send_message(recipient_id, "Por favor ingrese un número valido...")
+            else:
+                send_message(recipient_id, "Please enter a valid number...")
+    else:
+        # Handle the user question now, routing it to the best agent                            
+        # (the language detected at the greeting is reused)
+        # If no agent is available, the customer is told which agent it got later (see get_router)
+        response_text = get_router().route_to_best_agent(context.contact_id, text, context.language, recipient_id)
+        send_message(recipient_id, response_text)
+        # Done with this contact - reset flow                            
+        context.conversation_stage = waiting_for_greeting
+
+
+# User messages are handled in the background by a pool of workers:
+# the webhook acknowledges Facebook immediately, so slow APIs don't delay
+# the acknowledgement (which would make Facebook send the messages again).
+message_workers = MessageWorkers(handle_message, number_of_workers=8, queue_size=100)
+
+
+# Readiness probe: the bot answers greetings as soon as it starts,
+# but questions are only routed quickly once the AIRouter is ready.
+@app.route('/ready', methods=['GET'])
+def handle_readiness_check():
+    if router_ready.is_set():
+        return "Ready"
+    return "Warming up", 503
+
+
+# The contact center reports the state of the agents at this endpoint, ex:
+# {"agent id": 2, "state": "ready"} (or "busy", "offline") when an agent
+# changes state, {"agent id": 2, "chat": "ended"} when a chat is closed.
+# Interactions are only routed to ready agents with free chats. The chats
+# routed by the bot only count if router.reserve_chats is set, which needs
+# the contact center to report "ended" for every chat.
+# Events without the agent events token are rejected (403).
+@app.route('/agents/events', methods=['POST'])
+def handle_agent_event():
+    if not agent_states_enabled:
+        return "Agent states are not available with -prefork", 501
+
+    if not hmac.compare_digest(request.headers.get("X-Agent-Events-Token", ""), AGENT_EVENTS_TOKEN):
+        return "Invalid agent events token", 403
+
+    try:
+        event = request.get_json(silent=True)
+        if event is None:
+            return "Invalid event: the body is not JSON", 400
+        agent_id = int(event["agent id"])
+        if "state" in event:
+            updated = agents.states.set_state(agent_id, agent_state_names[event["state"]])
+        elif event.get("chat") == "ended":
+            updated = agents.states.end_chat(agent_id)
+        elif event.get("chat") == "started":
+            # Chat assigned by the contact center itself
+            updated = agents.states.start_chat(agent_id)
+        else:
+            return "Unknown event", 400
+    except (KeyError, TypeError, ValueError) as e:
+        return "Invalid event: {}".format(e), 400
+
+    if not updated:
+        return "Not applied", 409
+    return "OK"
 
 
 def verify_fb_token(token_sent):
@@ -205,7 +315,8 @@ def send_message(recipient_id, message, verbose=False):
             'text': message
         }        
     }
-    response  = requests.post("https://graph.facebook.com/v3.0/me/messages", params=params, json=payload)
+    # Not idempotent: a message must not be sent twice
+    response  = HttpClient.post("https://graph.facebook.com/v3.0/me/messages", idempotent=False, params=params, json=payload)
     result = response.json()
 
     if verbose:
@@ -231,9 +342,31 @@ def get_number_from_text(text):
 
 if __name__ == '__main__':
     if len(sys.argv) > 1 and sys.argv[1]=="-train":
-        router.train()
+        # Usage: python3 AIRoutingBot.py -train [history file (.csv, .jsonl or columns directory)]
+        if len(sys.argv) > 2:
+            get_router().train(sys.argv[2])
+        else:
+            get_router().train()
+    elif len(sys.argv) > 1 and sys.argv[1]=="-prefork":
+        # Usage: python3 AIRoutingBot.py -prefork [number of worker processes]
+        # The router (ranking weights, agent skills, contact features) is loaded once
+        # and shared by all the workers
+        import PreforkServer
+        # Messages of a conversation can reach any worker: contexts must be shared
+        if context_store_file is None:
+            context_store = SQLiteContextStore("contexts.db", ttl=3600)
+        # Agent states and waiting interactions can't be shared (see agent_states_enabled)
+        agent_states_enabled = False
+        number_of_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+        PreforkServer.serve(app, get_router, port=5001, number_of_workers=number_of_workers)
     else:
-        app.run(port=5001, debug=True)
+        # With the reloader (debug mode), the bot is served by a child process
+        # (WERKZEUG_RUN_MAIN is set in it): the parent only watches the files,
+        # so it does not need a router
+        use_reloader = True
+        if not use_reloader or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            start_router_warm_up()
+        app.run(port=5001, debug=True, use_reloader=use_reloader)
 
 
 
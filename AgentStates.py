@@ -0,0 +1,255 @@
+# -----------------------------------------------------
+# AgentStates module by Ricardo Santos.
+# Keeps the real-time state of the agents (ready, busy,
+# offline), the chats they are handling and how many
+# they can handle, so interactions are only routed
+# to agents that can take them.
+# -----------------------------------------------------
+
+# Dependencies
+import threading
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+
+
+# Agent states, as reported by the contact center
+offline = 0     # Not logged in
+ready = 1       # Taking interactions
+busy = 2        # Logged in but not taking new interactions (break, wrap-up...)
+
+state_names = {"offline": offline, "ready": ready, "busy": busy}
+
+
+class AgentState(object):
+    """ State of one agent, the number of chats it is handling and the maximum.
+    """
+
+    __slots__ = ["state", "chats", "capacity"]
+
+    def __init__(self, state, capacity):
+        self.state = state
+        self.chats = 0
+        self.capacity = capacity
+
+    def is_available(self):
+        return self.state == ready and self.chats < self.capacity
+
+
+class AgentStates(object):
+    """ State of every agent of an Agents object, plus available_mask, that
+        tells for every row of its skill index whether that agent is available
+        (ready and below its capacity). A state change only touches the row of
+        one agent, so it takes the same time whatever the size of the contact
+        center, and the available agents with some skill are selected with
+        vectorized operations on the mask and the skill matrix.
+        The capacity of an agent is its "capacity" field, or default_capacity.
+        Agents start in 'initial_state'. Thread-safe.
+    """
+
+    def __init__(self, agents, initial_state=ready, default_capacity=2):
+        self.agents = agents
+        self.skill_index = agents.skill_index
+        self.initial_state = initial_state
+        self.default_capacity = default_capacity
+
+        self.states_by_id = {}
+        self.available_mask = np.zeros(0, dtype=bool)
+        self.lock = threading.Lock()
+
+        # Callbacks called with the id of an agent that becomes available
+        self.listeners = []
+
+        # Agents added, changed or removed are indexed again
+        agents.add_listener(self.on_agent_changed)
+        self.on_agent_changed(None)
+
+
+    def on_agent_changed(self, agent_id):
+        """ Updates the states after a change of the agent profiles (None: all of them).
+        """
+        with self.lock:
+            if agent_id is None:
+                states_by_id = {}
+                for agent in self.agents.agents:
+                    state = self.states_by_id.get(agent["agent id"])
+                    if state is None:
+                        state = AgentState(self.initial_state, self.default_capacity)
+                    state.capacity = agent.get("capacity", self.default_capacity)
+                    states_by_id[agent["agent id"]] = state
+                self.states_by_id = states_by_id
+                self.reindex_agents()
+                return
+
+            agent = self.agents.get_agent_by_id(agent_id)
+            if agent is None:
+                self.states_by_id.pop(agent_id, None)
+                self.on_agent_removed(agent_id)
+                return
+
+            state = self.states_by_id.get(agent_id)
+            if state is None:
+                state = AgentState(self.initial_state, self.default_capacity)
+                self.states_by_id[agent_id] = state
+            state.capacity = agent.get("capacity", self.default_capacity)
+            self.index_agent(agent_id)
+
+
+    def add_listener(self, callback):
+        """ Registers a function to be called as callback(agent_id) whenever an agent
+            becomes available (ex: to give it an interaction that is waiting).
+            Callbacks are called without holding the lock, so they may change the states.
+        """
+        self.listeners.append(callback)
+
+
+    def notify(self, agent_id):
+        for callback in self.listeners:
+            callback(agent_id)
+
+
+    def reindex_agents(self):
+        self.available_mask = np.zeros(len(self.skill_index.agent_ids), dtype=bool)
+        for agent_id in self.states_by_id:
+            self.index_agent(agent_id)
+
+
+    def on_agent_removed(self, agent_id):
+        """ Follows the removal of an agent from the skill index, which moved the
+            agent of its last row to the freed row: only those two rows change.
+        """
+        last = len(self.skill_index)
+        if last < len(self.available_mask):
+            self.available_mask[last] = False
+        # agent_ids[last] still holds the agent that was in the last row
+        moved_agent_id = int(self.skill_index.agent_ids[last])
+        if moved_agent_id != agent_id:
+            self.index_agent(moved_agent_id)
+
+
+    def unindex_agent(self, agent_id):
+        row = self.skill_index.row_by_agent_id.get(agent_id)
+        if not row is None and row < len(self.available_mask):
+            self.available_mask[row] = False
+
+
+    def index_agent(self, agent_id):
+        """ Marks the row of an agent as available if it is, as unavailable otherwise.
+        """
+        state = self.states_by_id.get(agent_id)
+        row = self.skill_index.row_by_agent_id.get(agent_id)
+        if row is None:
+            return
+        if row >= len(self.available_mask):
+            # The skill index grew
+            available_mask = np.zeros(len(self.skill_index.agent_ids), dtype=bool)
+            available_mask[:len(self.available_mask)] = self.available_mask
+            self.available_mask = available_mask
+        self.available_mask[row] = not state is None and state.is_available()
+
+
+    def set_state(self, agent_id, state):
+        """ Changes the state of an agent (offline, ready or busy).
+            Returns False if the agent does not exist.
+        """
+        with self.lock:
+            agent_state = self.states_by_id.get(agent_id)
+            if agent_state is None:
+                return False
+            was_available = agent_state.is_available()
+            agent_state.state = state
+            if state == offline:
+                agent_state.chats = 0
+            self.index_agent(agent_id)
+            became_available = agent_state.is_available() and not was_available
+
+        if became_available:
+            self.notify(agent_id)
+        return True
+
+
+    def start_chat(self, agent_id):
+        """ Assigns one more chat to an agent, if it is available.
+            Returns False if it is not (ex: another interaction took its last free slot).
+        """
+        with self.lock:
+            agent_state = self.states_by_id.get(agent_id)
+            if agent_state is None or not agent_state.is_available():
+                return False
+            agent_state.chats += 1
+            if agent_state.chats == agent_state.capacity:
+                self.unindex_agent(agent_id)
+            return True
+
+
+    def end_chat(self, agent_id, notify=True):
+        """ Frees a chat of an agent. Returns False if the agent does not exist.
+            With notify=False the listeners are not told that the agent is available.
+        """
+        with self.lock:
+            agent_state = self.states_by_id.get(agent_id)
+            if agent_state is None:
+                return False
+            became_available = False
+            if agent_state.chats > 0:
+                agent_state.chats -= 1
+                if agent_state.chats == agent_state.capacity - 1:
+                    self.index_agent(agent_id)
+                    became_available = agent_state.is_available()
+
+        if became_available and notify:
+            self.notify(agent_id)
+        return True
+
+
+    def get_state(self, agent_id):
+        """ Returns (state, chats, capacity) of an agent, or None if it does not exist.
+        """
+        with self.lock:
+            agent_state = self.states_by_id.get(agent_id)
+            if agent_state is None:
+                return None
+            return agent_state.state, agent_state.chats, agent_state.capacity
+
+
+    def is_available(self, agent_id):
+        with self.lock:
+            agent_state = self.states_by_id.get(agent_id)
+            return not agent_state is None and agent_state.is_available()
+
+
+    def get_free_chats(self, agent_ids):
+        """ Returns the number of chats each agent can still take (0 if it is not ready).
+        """
+        free_chats = np.zeros(len(agent_ids), dtype=np.int64)
+        with self.lock:
+            for i in range(len(agent_ids)):
+                agent_state = self.states_by_id.get(int(agent_ids[i]))
+                if not agent_state is None and agent_state.state == ready:
+                    free_chats[i] = max(0, agent_state.capacity - agent_state.chats)
+        return free_chats
+
+
+    def get_available_mask(self, rows=None):
+        """ Returns, for some rows of the skill index (all of them if None), whether their agents are available.
+        """
+        with self.lock:
+            if rows is None:
+                available = np.zeros(len(self.skill_index), dtype=bool)
+                size = min(len(available), len(self.available_mask))
+                available[:size] = self.available_mask[:size]
+                return available
+            rows = np.asarray(rows, dtype=np.int64)
+            available = np.zeros(len(rows), dtype=bool)
+            inside = rows < len(self.available_mask)
+            available[inside] = self.available_mask[rows[inside]]
+        return available
+
+
+    def get_available_rows(self, skills):
+        """ Returns the rows of the skill index (sorted) of the available agents
+            having at least one of the given skills (ex: ["en", "sales"]).
+            Skills unknown to the index are ignored.
+        """
+        columns = [self.skill_index.column_map[skill] for skill in skills if skill in self.skill_index.column_map]
+        available = self.get_available_mask()
+        available &= np.any(self.skill_index.skills[:len(available), columns] > 0., axis=1)
+        return np.flatnonzero(available)
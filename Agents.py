@@ -3,26 +3,103 @@
 # Defines some fictional agent profiles.
 # -----------------------------------------------------
 
+# Dependencies
+from SkillIndex import SkillIndex
+from AgentStates import AgentStates
+
 class Agents(object):
     """ Some hardcoded agent info to be used by the routing algorithm.
         Corresponds to all the agents in the contact center.
     """
 
     def __init__(self):
-        self.agents = [
+        # Skills used by the routing algorithm (languages and intents).
+        # They are kept in an index so candidates can be selected
+        # without scanning every agent.
+        self.skill_columns = ["en", "es", "sales", "support"]
+        self.skill_index = SkillIndex(self.skill_columns)
+
+        # Agents are stored by id, so lookups do not scan the whole contact center
+        self.agents_by_id = {}
+
+        # Callbacks called with the id of every agent that changes
+        # (None when all the agents are reloaded)
+        self.listeners = []
+
+        # Real-time state of the agents (ready, busy, offline) and their chats
+        self.states = AgentStates(self)
+
+        self.load_agents([
             {"agent id": 0, "name": "Mike",   "en": 0.75, "es": 0.75, "support": 1.00, "sales": 0.00},
             {"agent id": 1, "name": "Sandra", "en": 0.50, "es": 1.00, "support": 1.00, "sales": 0.00},
             {"agent id": 2, "name": "John",   "en": 1.00, "es": 0.00, "support": 0.00, "sales": 1.00},
             {"agent id": 3, "name": "Betty",  "en": 0.50, "es": 0.50, "support": 0.00, "sales": 1.00},
             {"agent id": 4, "name": "Harry",  "en": 0.75, "es": 0.00, "support": 1.00, "sales": 1.00},
-            {"agent id": 5, "name": "Chris",  "en": 0.20, "es": 0.75, "support": 1.00, "sales": 1.00}]
+            {"agent id": 5, "name": "Chris",  "en": 0.20, "es": 0.75, "support": 1.00, "sales": 1.00}])
+
+
+    @property
+    def agents(self):
+        """ All the agents, in insertion order.
+        """
+        return list(self.agents_by_id.values())
+
+    def add_listener(self, callback):
+        """ Registers a function to be called as callback(agent_id) whenever
+            an agent is added, updated or removed (agent_id is None after a bulk load).
+        """
+        self.listeners.append(callback)
 
+    def notify(self, agent_id):
+        for callback in self.listeners:
+            callback(agent_id)
+
+    def load_agents(self, agents):
+        """ Bulk load of agents (ex: initial population from a real contact center).
+            Replaces any agent already stored and rebuilds the skill index.
+        """
+        self.agents_by_id = dict((agent["agent id"], agent) for agent in agents)
+        self.skill_index.load_agents(self.agents_by_id.values())
+        self.notify(None)
+
+    def add_agent(self, agent):
+        """ Inserts an agent profile, replacing any agent with the same id,
+            and indexes its skills.
+        """
+        self.agents_by_id[agent["agent id"]] = agent
+        self.skill_index.set_agent(agent["agent id"], agent)
+        self.notify(agent["agent id"])
+
+    def update_agent(self, agent_id, fields):
+        """ Updates some fields of an agent (ex: {"es": 0.5}) and reindexes its skills.
+            Returns False if the agent does not exist.
+        """
+        agent = self.agents_by_id.get(agent_id)
+        if agent is None:
+            return False
+        agent.update(fields)
+        self.skill_index.set_agent(agent_id, agent)
+        self.notify(agent_id)
+        return True
+
+    def set_agent_skills(self, agent_id, skills):
+        """ Updates some skills of an agent (ex: {"es": 0.5}).
+            Returns False if the agent does not exist.
+        """
+        return self.update_agent(agent_id, skills)
+
+    def remove_agent(self, agent_id):
+        """ Deletes an agent profile and its skills from the index.
+            Returns the removed agent or None.
+        """
+        agent = self.agents_by_id.pop(agent_id, None)
+        if not agent is None:
+            self.skill_index.remove_agent(agent_id)
+            self.notify(agent_id)
+        return agent
 
     def get_agent_by_id(self, agent_id):
-        for agent in self.agents:
-            if agent["agent id"]==agent_id:
-                return agent
-        return None
+        return self.agents_by_id.get(agent_id)
 
     def get_agent_name(self, agent_id):
         agent = self.get_agent_by_id(agent_id)
@@ -30,4 +107,3 @@ class Agents(object):
             return agent["name"]
         else:
             return "Unknown"
-
@@ -0,0 +1,268 @@
+# -----------------------------------------------------
+# Assignment module by Ricardo Santos.
+# Assigns many interactions to many agents at once,
+# maximizing the total predicted success (instead of
+# giving each interaction its own best agent, which
+# piles the interactions on the strongest agents).
+# Agents may take several interactions (capacity).
+# -----------------------------------------------------
+
+# Dependencies
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+try:
+    # Optional: exact and faster solver (pip3 install scipy)
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+
+def get_values(scores, allowed, unassigned_value):
+    """ Value of every pair compared to leaving the interaction waiting
+        (-inf for the pairs that are not allowed).
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if allowed is None:
+        allowed = np.ones(scores.shape, dtype=bool)
+    if not np.any(allowed):
+        return np.full(scores.shape, -np.inf)
+
+    if unassigned_value is None:
+        # Low enough that giving up an assignment never pays for better scores elsewhere
+        # (which gain at most (high - low) per interaction)
+        low = np.min(scores[allowed])
+        high = np.max(scores[allowed])
+        unassigned_value = low - len(scores) * (high - low) - 1.0
+
+    return np.where(allowed, scores - unassigned_value, -np.inf)
+
+
+def get_prices(assigned, offers, capacities, reserve_prices):
+    """ Price of every object: the lowest offer it holds once it is full
+        (a new bidder must beat it), its reserve price otherwise.
+    """
+    holders = np.flatnonzero(assigned >= 0)
+    counts = np.bincount(assigned[holders], minlength=len(capacities))
+    lowest_offers = np.full(len(capacities), np.inf)
+    np.minimum.at(lowest_offers, assigned[holders], offers[holders])
+    return np.where(counts >= capacities, lowest_offers, reserve_prices)
+
+
+def auction(values, capacities=None, epsilon_min=None, epsilon_factor=5.0):
+    """ Auction algorithm (Bertsekas), with all the unassigned bidders bidding
+        at the same time (each round is a few matrix operations).
+        Rows are bidders, columns are objects; object j can be given to
+        capacities[j] bidders (1 if None) and every bidder may also stay
+        unassigned, with value 0. An object with capacity is auctioned as one
+        object: its price is the lowest offer it holds once it is full, so
+        bidders never fight over identical copies of it in tiny increments.
+        Epsilon scaling: the auction is repeated with a smaller bid increment
+        each time, starting from the last prices.
+        With room for more bidders than there are, the objects that are not
+        full at the end of a round must not be more expensive than the
+        assigned ones (see reverse_auction). The result is within (rows + sum of the capacities)
+        * epsilon_min of the best total value.
+        Returns the object of every bidder (-1: unassigned).
+    """
+    number_of_bidders, number_of_objects = values.shape
+    assigned = np.full(number_of_bidders, -1, dtype=np.int64)
+    if capacities is None:
+        capacities = np.ones(number_of_objects, dtype=np.int64)
+    capacities = np.maximum(np.asarray(capacities, dtype=np.int64), 0)
+    finite = np.isfinite(values) & (capacities > 0)
+    if number_of_objects == 0 or not np.any(finite):
+        return assigned
+    values = np.where(finite, values, -np.inf)
+
+    # Relative to the differences between the values (they may all be shifted by a large
+    # constant), but large enough to still raise the prices in floating point
+    value_spread = np.max(values[finite]) - np.min(values[finite])
+    if epsilon_min is None:
+        epsilon_min = max(value_spread * 1e-4 / (number_of_bidders + np.sum(capacities)),
+                          max(np.max(np.abs(values[finite])), 1e-12) * 1e-12)
+    if number_of_bidders <= np.sum(capacities):
+        epsilon = max(max(value_spread, np.max(values[finite]) * 1e-3) / epsilon_factor, epsilon_min)
+    else:
+        # Some bidders must be left out: the prices have to rise up to the values
+        epsilon = max(np.max(values[finite]) / epsilon_factor, epsilon_min)
+
+    reserve_prices = np.zeros(number_of_objects)
+    offers = np.zeros(number_of_bidders)
+    while True:
+        assigned[:] = -1
+        # Bidders without any allowed object stay unassigned
+        bidding = np.flatnonzero(np.any(finite, axis=1))
+
+        while len(bidding) > 0:
+            holders = np.flatnonzero(assigned >= 0)
+            prices = get_prices(assigned, offers, capacities, reserve_prices)
+
+            net = values[bidding] - prices
+            rows = np.arange(len(bidding))
+            best = net.argmax(axis=1)
+            best_value = net[rows, best]
+            net[rows, best] = -np.inf
+            if number_of_objects > 1:
+                second_value = np.maximum(net.max(axis=1), 0.0)
+            else:
+                second_value = np.zeros(len(bidding))
+
+            # Staying unassigned is the best option: prices only go up, so it stays so
+            bids = best_value > 0.0
+            bidders = bidding[bids]
+            objects = best[bids]
+            offers[bidders] = prices[objects] + best_value[bids] - second_value[bids] + epsilon
+
+            # Every object keeps its highest offers, old or new (the old ones first on ties)
+            targeted = np.zeros(number_of_objects, dtype=bool)
+            targeted[objects] = True
+            holders = holders[targeted[assigned[holders]]]
+            candidates = np.concatenate([holders, bidders])
+            candidate_objects = np.concatenate([assigned[holders], objects])
+            order = np.lexsort((-offers[candidates], candidate_objects))
+            candidates = candidates[order]
+            candidate_objects = candidate_objects[order]
+            starts = np.flatnonzero(np.r_[True, candidate_objects[1:] != candidate_objects[:-1]])
+            ranks = np.arange(len(candidates)) - np.repeat(starts, np.diff(np.r_[starts, len(candidates)]))
+            kept = ranks < capacities[candidate_objects]
+
+            # The outbid bidders bid again in the next round
+            assigned[candidates[kept]] = candidate_objects[kept]
+            bidding = candidates[~kept]
+            assigned[bidding] = -1
+
+        prices = get_prices(assigned, offers, capacities, reserve_prices)
+        # Done after every round, so the prices the next round starts from are consistent
+        reverse_auction(values, capacities, assigned, prices, epsilon)
+        if epsilon <= epsilon_min:
+            return assigned
+        reserve_prices = prices
+        epsilon = max(epsilon / epsilon_factor, epsilon_min)
+
+
+def reverse_auction(values, capacities, assigned, prices, epsilon):
+    """ Ends an asymmetric auction: the objects that are not full (left over by
+        earlier rounds) must not be more expensive than the cheapest assigned
+        object (0 if a bidder is unassigned). Those priced above it lower their
+        price and bid for the bidders, until none is. 'assigned' and 'prices' are updated.
+    """
+    has_object = assigned >= 0
+    counts = np.bincount(assigned[has_object], minlength=len(prices))
+    # Unassigned bidders hold their own "unassigned" object, with price 0
+    taken = prices[counts > 0]
+    if not np.all(has_object):
+        taken = np.append(taken, 0.0)
+    if len(taken) == 0:
+        return
+    threshold = np.min(taken)
+
+    bidding = np.flatnonzero((counts < capacities) & (prices > threshold))
+    while len(bidding) > 0:
+        has_object = assigned >= 0
+        profits = np.zeros(len(assigned))
+        profits[has_object] = values[has_object, assigned[has_object]] - prices[assigned[has_object]]
+
+        net = values[:, bidding] - profits[:, np.newaxis]
+        # An object does not bid for the bidders it already has
+        net[assigned[:, np.newaxis] == bidding] = -np.inf
+        columns = np.arange(len(bidding))
+        best = net.argmax(axis=0)
+        best_value = net[best, columns]
+        net[best, columns] = -np.inf
+        if len(assigned) > 1:
+            second_value = net.max(axis=0)
+        else:
+            second_value = np.full(len(bidding), -np.inf)
+
+        # No bidder worth lowering the price further
+        done = threshold >= best_value - epsilon
+        prices[bidding[done]] = threshold
+
+        bids = ~done
+        objects = bidding[bids]
+        bidders = best[bids]
+        offers = np.maximum(threshold, second_value[bids] - epsilon)
+        new_profits = values[bidders, objects] - offers
+
+        # Every bidder takes the offer that gives it the highest profit (the first one on ties)
+        order = np.lexsort((-new_profits, bidders))
+        bidders = bidders[order]
+        first = np.ones(len(bidders), dtype=bool)
+        first[1:] = bidders[1:] != bidders[:-1]
+        winners = objects[order][first]
+        won_bidders = bidders[first]
+        won_offers = offers[order][first]
+
+        # A new price lowers the price of every copy of the object, so the profits its
+        # bidders had when they took an offer are out of date: they wait for the next round
+        # (the first offer is always taken, so every round makes progress)
+        lowered = np.zeros(len(prices), dtype=bool)
+        lowered[bidding[done]] = True
+        lowered[winners] = True
+        previous = assigned[won_bidders]
+        accepted = (previous < 0) | ~lowered[np.maximum(previous, 0)]
+        if not np.any(accepted) and not np.any(done):
+            accepted[0] = True
+        winners = winners[accepted]
+        won_bidders = won_bidders[accepted]
+        previous = previous[accepted]
+
+        # The objects the bidders had before have room for another bidder now
+        np.subtract.at(counts, previous[previous >= 0], 1)
+        np.add.at(counts, winners, 1)
+        assigned[won_bidders] = winners
+        prices[winners] = won_offers[accepted]
+
+        bidding = np.flatnonzero((counts < capacities) & (prices > threshold))
+
+
+def solve_with_scipy(values):
+    """ Same as auction, solved exactly with scipy's linear_sum_assignment.
+        Every bidder gets its own "unassigned" column, with value 0, unless
+        no value is below 0 (then being unassigned is never better).
+    """
+    number_of_bidders, number_of_objects = values.shape
+    finite = np.isfinite(values)
+    big = 1e9
+    if np.all(values[finite] > 0.0):
+        cost = np.where(finite, -values, big)
+    else:
+        cost = np.full((number_of_bidders, number_of_objects + number_of_bidders), big)
+        cost[:, :number_of_objects] = np.where(finite, -values, big)
+        cost[np.arange(number_of_bidders), number_of_objects + np.arange(number_of_bidders)] = 0.0
+
+    assigned = np.full(number_of_bidders, -1, dtype=np.int64)
+    rows, columns = linear_sum_assignment(cost)
+    real = (columns < number_of_objects) & (cost[rows, np.minimum(columns, number_of_objects - 1)] < big)
+    assigned[rows[real]] = columns[real]
+    return assigned
+
+
+def assign(scores, capacities=None, allowed=None, unassigned_value=None, use_scipy=True):
+    """ Assigns interactions (rows of 'scores') to agents (columns), maximizing
+        the sum of the scores of the assigned pairs. An agent takes at most
+        capacities[j] interactions (1 if None); 'allowed' (same shape as scores)
+        marks the pairs that may be assigned (all if None). An interaction left
+        waiting is worth 'unassigned_value' (by default, low enough that giving up
+        an assignment never pays for a better score elsewhere).
+        Uses scipy if available (and use_scipy), the auction algorithm otherwise.
+        Returns the agent (column) of every interaction (-1: not assigned).
+    """
+    scores = np.asarray(scores)
+    number_of_interactions, number_of_agents = scores.shape
+    if capacities is None:
+        capacities = np.ones(number_of_agents, dtype=np.int64)
+    capacities = np.maximum(np.asarray(capacities, dtype=np.int64), 0)
+    values = get_values(scores, allowed, unassigned_value)
+
+    result = np.full(number_of_interactions, -1, dtype=np.int64)
+    if np.sum(capacities) == 0 or number_of_interactions == 0:
+        return result
+
+    if use_scipy and not linear_sum_assignment is None:
+        # Capacity: an agent that can take c interactions is c identical columns (slots)
+        slot_agents = np.repeat(np.arange(number_of_agents), capacities)
+        slots = solve_with_scipy(values[:, slot_agents])
+        result[slots >= 0] = slot_agents[slots[slots >= 0]]
+        return result
+
+    return auction(values, capacities)
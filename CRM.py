@@ -5,15 +5,25 @@
 # contact center.
 # -----------------------------------------------------
 
+# Dependencies
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+
+
 class CRM(object):
     """ Some hardcoded customer info to be used by the routing algorithm.
     """
 
     def __init__(self):
-        self.contacts = [
+        # Contacts are stored by id, so lookups do not scan the whole CRM
+        self.contacts_by_id = {}
+
+        # Callbacks called with the id of every contact that changes
+        # (None when all the contacts are reloaded)
+        self.listeners = []
+        self.load_contacts([
             {"contact id": 0, "name": "Mary", "age": 26, "postal code": "WC2N-5DU"},
             {"contact id": 1, "name": "Arnold", "age": 41, "postal code": "10005"},
-            {"contact id": 2, "name": "Ferdinand", "age": 35, "postal code": "28000-070"}]
+            {"contact id": 2, "name": "Ferdinand", "age": 35, "postal code": "28000-070"}])
 
         self.history = [
             {"contact id": 0, "handled by": 0, "language": "en", "sentiment": 0.50, "category": "support", "score": 0.70 },
@@ -37,11 +47,68 @@ class CRM(object):
             {"contact id": 2, "handled by": 3, "language": "es", "sentiment": 0.90, "category": "sales",   "score": 1.00 }]
 
 
+    @property
+    def contacts(self):
+        """ All the contacts, in insertion order.
+        """
+        return list(self.contacts_by_id.values())
+
+    def add_listener(self, callback):
+        """ Registers a function to be called as callback(contact_id) whenever
+            a contact is added, updated or removed (contact_id is None after a bulk load).
+        """
+        self.listeners.append(callback)
+
+    def notify(self, contact_id):
+        for callback in self.listeners:
+            callback(contact_id)
+
+    def load_contacts(self, contacts):
+        """ Bulk load of contacts (ex: initial population from a real CRM).
+            Replaces any contact already stored.
+        """
+        self.contacts_by_id = dict((contact["contact id"], contact) for contact in contacts)
+        self.notify(None)
+
+    def add_contact(self, contact):
+        """ Inserts a contact, replacing any contact with the same id.
+        """
+        self.contacts_by_id[contact["contact id"]] = contact
+        self.notify(contact["contact id"])
+
+    def update_contact(self, contact_id, fields):
+        """ Updates some fields of a contact (ex: {"postal code": "10005"}).
+            Returns False if the contact does not exist.
+        """
+        contact = self.contacts_by_id.get(contact_id)
+        if contact is None:
+            return False
+        contact.update(fields)
+        self.notify(contact_id)
+        return True
+
+    def remove_contact(self, contact_id):
+        """ Deletes a contact. Returns the removed contact or None.
+        """
+        contact = self.contacts_by_id.pop(contact_id, None)
+        if not contact is None:
+            self.notify(contact_id)
+        return contact
+
     def get_contact_by_id(self, contact_id):
-        for contact in self.contacts:
-            if contact["contact id"]==contact_id:
-                return contact
-        return None
+        return self.contacts_by_id.get(contact_id)
+
+    def get_history_columns(self):
+        """ Returns the history as columns (numpy arrays), one per field:
+            "contact id", "handled by", "language", "sentiment", "category" and "score".
+        """
+        return {
+            "contact id": np.array([row["contact id"] for row in self.history], dtype=np.int64),
+            "handled by": np.array([row["handled by"] for row in self.history], dtype=np.int64),
+            "language": np.array([row["language"] for row in self.history], dtype=str),
+            "sentiment": np.array([row["sentiment"] for row in self.history], dtype=np.float32),
+            "category": np.array([row["category"] for row in self.history], dtype=str),
+            "score": np.array([row["score"] for row in self.history], dtype=np.float32)}
 
     def get_contact_name(self, contact_id):
         contact = self.get_contact_by_id(contact_id)
@@ -0,0 +1,158 @@
+# -----------------------------------------------------
+# Cache module by Ricardo Santos.
+# Caches the results of slow lookups (ex: calls to
+# cloud APIs) with an expiry time.
+# -----------------------------------------------------
+
+# Dependencies
+import os
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """ In-memory key-value cache with expiry and a maximum number of entries
+        (the least recently used entry is dropped when full).
+        Counts hits and misses. If a 'shared' cache is given (ex: a SQLiteCache
+        opened by every worker process), it is used as a second level:
+        misses are looked up there and new values are written to both.
+        Thread-safe.
+    """
+
+    def __init__(self, max_size=10000, ttl=3600, shared=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared = shared
+        self.entries = OrderedDict()   # key -> (expires, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def get(self, key):
+        """ Returns (found, value). Expired entries are not found.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry is None:
+                if entry[0] >= time.time():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[1]
+                del self.entries[key]
+
+        if not self.shared is None:
+            found, value = self.shared.get(key)
+            if found:
+                self.store(key, value, self.ttl)
+                with self.lock:
+                    self.hits += 1
+                return True, value
+
+        with self.lock:
+            self.misses += 1
+        return False, None
+
+
+    def set(self, key, value, ttl=None):
+        """ Stores a value for 'ttl' seconds (the cache default if None).
+        """
+        if ttl is None:
+            ttl = self.ttl
+        self.store(key, value, ttl)
+        if not self.shared is None:
+            self.shared.set(key, value, ttl)
+
+
+    def store(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.time() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+    def get_stats(self):
+        """ Returns a dict with the number of hits and misses and the hit rate.
+        """
+        with self.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit rate": float(self.hits) / total if total > 0 else 0.0,
+                    "size": len(self.entries)}
+
+
+class SQLiteCache(object):
+    """ Key-value cache with expiry, stored in a SQLite file.
+        Survives restarts and is shared by all the processes that open
+        the same file. Values must be JSON serializable; None is a valid
+        value (ex: to remember that a lookup failed).
+    """
+
+    def __init__(self, filename, table="cache", ttl=30*24*3600):
+        self.filename = filename
+        self.table = table
+        self.ttl = ttl
+
+        # SQLite connections can't be shared between threads: one per thread
+        self.local = threading.local()
+
+        connection = self.get_connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY, value TEXT, expires REAL)".format(self.table))
+        connection.commit()
+
+
+    def get_connection(self):
+        connection = getattr(self.local, "connection", None)
+        # A connection opened before a fork must not be used by the child process
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.filename, timeout=10.0)
+            # Write-ahead logging lets readers in other processes work while one process writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+
+    def get(self, key):
+        """ Returns (found, value). Expired entries are not found.
+        """
+        row = self.get_connection().execute(
+            "SELECT value, expires FROM {} WHERE key=?".format(self.table), (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return False, None
+        return True, json.loads(row[0])
+
+
+    def set(self, key, value, ttl=None):
+        """ Stores a value for 'ttl' seconds (the cache default if None).
+        """
+        if ttl is None:
+            ttl = self.ttl
+        connection = self.get_connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO {} (key, value, expires) VALUES (?, ?, ?)".format(self.table),
+            (key, json.dumps(value), time.time() + ttl))
+        connection.commit()
+
+
+    def delete(self, key):
+        connection = self.get_connection()
+        connection.execute("DELETE FROM {} WHERE key=?".format(self.table), (key,))
+        connection.commit()
+
+
+    def purge_expired(self):
+        """ Deletes the expired entries from the file.
+        """
+        connection = self.get_connection()
+        connection.execute("DELETE FROM {} WHERE expires < ?".format(self.table), (time.time(),))
+        connection.commit()
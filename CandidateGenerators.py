@@ -0,0 +1,189 @@
+# -----------------------------------------------------
+# CandidateGenerators module by Ricardo Santos.
+# First step of the routing: selects the agents worth
+# ranking for an interaction. The exact generator scores
+# every available agent; the IVF generator only looks at
+# the groups of agents closest to the interaction, so
+# large contact centers are searched in sublinear time.
+# -----------------------------------------------------
+
+# Dependencies
+import threading
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+
+
+def k_means(points, number_of_clusters, iterations=20, random=None):
+    """ Groups points (one per row) in clusters with Lloyd's algorithm.
+        Returns (centroids, cluster of every point).
+    """
+    if random is None:
+        random = np.random.RandomState(0)
+    points = np.asarray(points, dtype=np.float32)
+    number_of_clusters = max(1, min(number_of_clusters, len(points)))
+
+    centroids = points[random.choice(len(points), number_of_clusters, replace=False)].copy()
+    squared_norms = np.sum(points * points, axis=1)
+    for iteration in range(iterations):
+        # Squared distances without building (points x clusters x dimensions)
+        distances = squared_norms[:, np.newaxis] - 2.0 * np.dot(points, centroids.T) \
+            + np.sum(centroids * centroids, axis=1)
+        labels = distances.argmin(axis=1)
+
+        counts = np.bincount(labels, minlength=number_of_clusters)
+        sums = np.zeros(centroids.shape, dtype=np.float64)
+        np.add.at(sums, labels, points)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, np.newaxis]
+        # An empty cluster takes the point farthest from its centroid
+        if np.any(empty):
+            farthest = np.argsort(-distances[np.arange(len(points)), labels])[:np.sum(empty)]
+            centroids[empty] = points[farthest]
+
+    distances = squared_norms[:, np.newaxis] - 2.0 * np.dot(points, centroids.T) + np.sum(centroids * centroids, axis=1)
+    return centroids, distances.argmin(axis=1)
+
+
+class ExactCandidateGenerator(object):
+    """ Scores every available agent with some skill for the job.
+        The skill for the job is the weighted skill sum of the agent, with
+        weight 1 for the skills needed by the interaction (language and
+        intent) and 0 for the others.
+    """
+
+    def __init__(self, agents):
+        self.agents = agents
+
+
+    def generate(self, language, intent, k):
+        """ Returns up to k tuples (agent id, skill for the job), best first.
+        """
+        # Only the available agents (logged, ready to work and not at their
+        # maximum number of chats) with some skill for the job are candidates.
+        weights = self.agents.skill_index.query_vector(language, intent)
+        return self.agents.skill_index.top_k(weights, k, self.agents.states.get_available_mask())
+
+
+    def generate_batch(self, interactions, k):
+        """ Same as generate for a list of (language, intent) pairs,
+            all scored in a single matrix product.
+        """
+        weights = self.agents.skill_index.query_matrix(interactions)
+        skills = set()
+        for language, intent in interactions:
+            skills.update([language, intent])
+        rows = self.agents.states.get_available_rows(skills)
+        return self.agents.skill_index.top_k_batch(weights, k, rows)
+
+
+class IVFCandidateGenerator(object):
+    """ Approximate candidate generation with an inverted file index (IVF).
+        The embedding of an agent is its row of skills and the embedding of an
+        interaction its weight vector, so their dot product is the skill for
+        the job of the exact generator. Agents are grouped by k-means in
+        'number_of_lists' lists (about the square root of the number of agents
+        if None); an interaction only scores the agents of the 'nprobe' lists
+        whose centroids fit it best. More lists probed: better recall, slower.
+        The index follows the changes of the agents: the lists are rebuilt
+        with the same centroids on the next query, and the centroids are
+        trained again after a bulk load or when the number of agents has
+        doubled or halved.
+    """
+
+    def __init__(self, agents, number_of_lists=None, nprobe=4, seed=0):
+        self.agents = agents
+        self.skill_index = agents.skill_index
+        self.number_of_lists = number_of_lists
+        self.nprobe = nprobe
+        self.random = np.random.RandomState(seed)
+
+        self.centroids = None
+        self.trained_size = 0
+        # Rows of the skill index grouped by list: the rows of list l are
+        # list_rows[list_starts[l]:list_starts[l + 1]]
+        self.list_rows = None
+        self.list_starts = None
+        self.stale = True
+        self.lock = threading.Lock()
+
+        agents.add_listener(self.on_agent_changed)
+
+
+    def on_agent_changed(self, agent_id):
+        with self.lock:
+            if agent_id is None:
+                self.centroids = None
+            self.stale = True
+
+
+    def train(self):
+        """ Computes the centroids of the lists with k-means (on a sample of the agents).
+        """
+        size = len(self.skill_index)
+        number_of_lists = self.number_of_lists
+        if number_of_lists is None:
+            number_of_lists = int(np.sqrt(size))
+        number_of_lists = max(1, min(number_of_lists, size))
+
+        sample = self.random.choice(size, min(size, 64 * number_of_lists), replace=False)
+        self.centroids, labels = k_means(self.skill_index.skills[sample], number_of_lists, random=self.random)
+        self.trained_size = size
+
+
+    def build(self):
+        """ Puts every agent in the list of its closest centroid (training them if needed).
+        """
+        size = len(self.skill_index)
+        if size == 0:
+            self.centroids = None
+            self.list_rows = np.zeros(0, dtype=np.int64)
+            self.list_starts = np.zeros(1, dtype=np.int64)
+            self.stale = False
+            return
+
+        if self.centroids is None or size > 2 * self.trained_size or 2 * size < self.trained_size:
+            self.train()
+
+        skills = self.skill_index.skills[:size]
+        distances = -2.0 * np.dot(skills, self.centroids.T) + np.sum(self.centroids * self.centroids, axis=1)
+        labels = distances.argmin(axis=1)
+        self.list_rows = np.argsort(labels, kind="mergesort")
+        self.list_starts = np.searchsorted(labels[self.list_rows], np.arange(len(self.centroids) + 1))
+        self.stale = False
+
+
+    def probe(self, weights):
+        """ Returns the rows of the skill index (sorted) in the nprobe lists that fit the weights best.
+        """
+        with self.lock:
+            if self.stale:
+                self.build()
+            centroids, list_rows, list_starts = self.centroids, self.list_rows, self.list_starts
+
+        if centroids is None:
+            return np.zeros(0, dtype=np.int64)
+
+        centroid_scores = np.dot(centroids, weights)
+        nprobe = min(self.nprobe, len(centroids))
+        if nprobe < len(centroids):
+            lists = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            lists = np.arange(len(centroids))
+        rows = np.concatenate([list_rows[list_starts[l]:list_starts[l + 1]] for l in lists])
+        rows.sort()
+        return rows
+
+
+    def generate(self, language, intent, k):
+        """ Returns up to k tuples (agent id, skill for the job), best first
+            (approximate: agents outside the probed lists are not seen).
+        """
+        weights = self.skill_index.query_vector(language, intent)
+        rows = self.probe(weights)
+        rows = rows[self.agents.states.get_available_mask(rows)]
+        return self.skill_index.top_k_rows(weights, rows, k)
+
+
+    def generate_batch(self, interactions, k):
+        """ Same as generate for a list of (language, intent) pairs.
+        """
+        return [self.generate(language, intent, k) for language, intent in interactions]
@@ -0,0 +1,175 @@
+# -----------------------------------------------------
+# ContextStore module by Ricardo Santos.
+# Keeps the context of the conversations of the bot,
+# forgetting the conversations that have been idle
+# for too long. Contexts can be kept in memory (one
+# process) or in a SQLite file (shared by processes).
+# -----------------------------------------------------
+
+# Dependencies
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# Our bot will not have complex flows with a real authentication phase...
+# For the sake of simplicity, the conversation will have 3 stages only,
+# one to start a conversation, one for asking the contact id and
+# a last one to receive the question from the user.
+waiting_for_greeting = 0
+waiting_for_contact_id = 1
+waiting_for_question = 2
+
+
+class ConversationContext(object):
+    """
+        Here we'll keep the contact id from the user
+        (if contact_id >= 0, the user is registered in our CRM)
+        and the conversation stage.
+    """
+
+    # No per-instance dict: contexts stay small even with many users
+    __slots__ = ["contact_id", "language", "conversation_stage"]
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.contact_id = -1
+        self.language = "en"
+        self.conversation_stage = waiting_for_greeting
+
+
+class MemoryContextStore(object):
+    """ Conversation contexts kept in memory, by recipient id.
+        A context not used for 'ttl' seconds is forgotten (the conversation
+        starts again), and at most 'max_size' contexts are kept (the least
+        recently used are dropped). Contexts are split in shards, each one
+        with its own lock, so concurrent workers rarely wait for each other.
+    """
+
+    def __init__(self, ttl=3600, max_size=100000, number_of_shards=16):
+        self.ttl = ttl
+        self.max_size_per_shard = max(1, max_size // number_of_shards)
+        self.shards = [OrderedDict() for i in range(number_of_shards)]  # recipient id -> (last use, context)
+        self.locks = [threading.Lock() for i in range(number_of_shards)]
+
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+
+    def get(self, recipient_id):
+        """ Returns the context of a recipient (a new one if unknown or expired).
+        """
+        index = hash(recipient_id) % len(self.shards)
+        shard = self.shards[index]
+        now = time.time()
+
+        with self.locks[index]:
+            entry = shard.get(recipient_id)
+            if entry is None or entry[0] + self.ttl < now:
+                context = ConversationContext()
+            else:
+                context = entry[1]
+            shard[recipient_id] = (now, context)
+            shard.move_to_end(recipient_id)
+
+            # Drop the least recently used contexts, and the expired ones at the front
+            while len(shard) > self.max_size_per_shard:
+                shard.popitem(last=False)
+            while len(shard) > 0:
+                oldest = next(iter(shard.values()))
+                if oldest[0] + self.ttl >= now:
+                    break
+                shard.popitem(last=False)
+
+        return context
+
+
+    def save(self, recipient_id, context):
+        """ Stores a context after it has been changed.
+        """
+        index = hash(recipient_id) % len(self.shards)
+        with self.locks[index]:
+            self.shards[index][recipient_id] = (time.time(), context)
+            self.shards[index].move_to_end(recipient_id)
+
+
+class SQLiteContextStore(object):
+    """ Conversation contexts kept in a SQLite file, by recipient id,
+        so that several processes of the bot can serve the same conversations.
+        A context not used for 'ttl' seconds is forgotten.
+        Contexts must be saved after being changed.
+    """
+
+    def __init__(self, filename, ttl=3600, purge_interval=60):
+        self.filename = filename
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.last_purge = 0.0
+
+        # SQLite connections can't be shared between threads: one per thread
+        self.local = threading.local()
+
+        connection = self.get_connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS contexts (recipient_id TEXT PRIMARY KEY, "
+            "contact_id INTEGER, language TEXT, conversation_stage INTEGER, last_use REAL)")
+        connection.commit()
+
+
+    def __len__(self):
+        return self.get_connection().execute("SELECT COUNT(*) FROM contexts").fetchone()[0]
+
+
+    def get_connection(self):
+        connection = getattr(self.local, "connection", None)
+        # A connection opened before a fork must not be used by the child process
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.filename, timeout=10.0)
+            # Write-ahead logging lets readers in other processes work while one process writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+
+    def get(self, recipient_id):
+        """ Returns the context of a recipient (a new one if unknown or expired).
+        """
+        now = time.time()
+        if now - self.last_purge > self.purge_interval:
+            self.purge_expired()
+
+        context = ConversationContext()
+        row = self.get_connection().execute(
+            "SELECT contact_id, language, conversation_stage, last_use FROM contexts WHERE recipient_id=?",
+            (str(recipient_id),)).fetchone()
+        if not row is None and row[3] + self.ttl >= now:
+            context.contact_id = row[0]
+            context.language = row[1]
+            context.conversation_stage = row[2]
+        return context
+
+
+    def save(self, recipient_id, context):
+        """ Stores a context after it has been changed.
+        """
+        connection = self.get_connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO contexts (recipient_id, contact_id, language, conversation_stage, last_use) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (str(recipient_id), context.contact_id, context.language, context.conversation_stage, time.time()))
+        connection.commit()
+
+
+    def purge_expired(self):
+        """ Deletes the expired contexts from the file.
+        """
+        self.last_purge = time.time()
+        connection = self.get_connection()
+        connection.execute("DELETE FROM contexts WHERE last_use < ?", (time.time() - self.ttl,))
+        connection.commit()
@@ -0,0 +1,95 @@
+# -----------------------------------------------------
+# FeatureEncoder module by Ricardo Santos.
+# Converts the text fields of an interaction (language
+# and category) to vectors for the ranking network,
+# using lookup tables built once from the configuration
+# instead of a branch per value.
+# -----------------------------------------------------
+
+# Dependencies
+import zlib
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+
+
+# Default configuration: the columns of the trained weights.h5
+# (en = [0, 1], es = [1, 0], sales = [0, 1], support = [1, 0])
+default_languages = ["es", "en"]
+default_categories = ["support", "sales"]
+
+
+class CategoricalEncoder(object):
+    """ One-hot encoding of a text field: one column per value of the
+        vocabulary, plus 'hash_buckets' columns shared by any other value
+        (the column is picked by a hash of the value, the same in every
+        process). Without hash buckets, other values are all zeros.
+    """
+
+    def __init__(self, vocabulary, hash_buckets=0):
+        self.vocabulary = list(vocabulary)
+        self.hash_buckets = hash_buckets
+        self.size = len(self.vocabulary) + hash_buckets
+        self.column_by_value = dict((self.vocabulary[i], i) for i in range(len(self.vocabulary)))
+
+
+    def get_column(self, value):
+        """ Returns the column set to 1 for a value (-1: none).
+        """
+        column = self.column_by_value.get(value)
+        if not column is None:
+            return column
+        if self.hash_buckets > 0:
+            return len(self.vocabulary) + zlib.crc32(str(value).encode("utf-8")) % self.hash_buckets
+        return -1
+
+
+    def get_columns(self, values):
+        """ Same as get_column for a column of values: each distinct value is looked up once.
+        """
+        unique_values, codes = np.unique(np.asarray(values), return_inverse=True)
+        columns = np.array([self.get_column(value) for value in unique_values], dtype=np.int64)
+        return columns[codes.ravel()]
+
+
+    def encode(self, values, out=None):
+        """ Encodes a column of values into 'out' (rows x size), created if None.
+            Returns 'out'.
+        """
+        columns = self.get_columns(values)
+        if out is None:
+            out = np.zeros((len(columns), self.size), dtype=np.float32)
+        else:
+            out[:] = 0.0
+        rows = np.flatnonzero(columns >= 0)
+        out[rows, columns[rows]] = 1.0
+        return out
+
+
+class FeatureEncoder(object):
+    """ Interaction features of the ranking network: language, sentiment
+        and category. 'size' is the number of columns they take.
+        The default configuration is the one the bundled weights were
+        trained with; other vocabularies (or hash buckets) need a network
+        trained with the same configuration.
+    """
+
+    def __init__(self, languages=None, categories=None, language_hash_buckets=0, category_hash_buckets=0):
+        if languages is None:
+            languages = default_languages
+        if categories is None:
+            categories = default_categories
+        self.languages = CategoricalEncoder(languages, language_hash_buckets)
+        self.categories = CategoricalEncoder(categories, category_hash_buckets)
+        self.size = self.languages.size + 1 + self.categories.size
+
+
+    def encode(self, languages, sentiments, categories, out=None):
+        """ Encodes columns of languages, sentiments and categories into 'out'
+            (rows x size), created if None. Returns 'out'.
+        """
+        if out is None:
+            out = np.zeros((len(sentiments), self.size), dtype=np.float32)
+        column = self.languages.size
+        self.languages.encode(languages, out[:, :column])
+        out[:, column] = sentiments
+        self.categories.encode(categories, out[:, column + 1:])
+        return out
@@ -0,0 +1,306 @@
+# -----------------------------------------------------
+# FeatureStore module by Ricardo Santos.
+# Precomputes the contact and agent features used by
+# the ranking network and keeps them in arrays,
+# so a ranking only has to gather a few rows.
+# -----------------------------------------------------
+
+# Dependencies
+import os
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+from Geocoding import find_GPS_coordinates
+
+
+class FeatureTable(object):
+    """ Feature vectors (one float32 row per id) with an id -> row index.
+        Rows are updated incrementally; deleted rows are reused by moving
+        the last row into their place.
+    """
+
+    def __init__(self, columns, initial_capacity=64):
+        self.columns = list(columns)
+        self.data = np.zeros((initial_capacity, len(self.columns)), dtype=np.float32)
+        self.ids = np.zeros(initial_capacity, dtype=np.int64)
+        self.row_by_id = {}
+        self.size = 0
+
+        # Ids sorted, with their rows, to map many ids at once (see rows).
+        # Rebuilt after rows are added or removed.
+        self.sorted_ids = None
+        self.sorted_rows = None
+
+
+    def __len__(self):
+        return self.size
+
+
+    def __contains__(self, id):
+        return id in self.row_by_id
+
+
+    def set(self, id, features):
+        """ Inserts or updates the features of an id.
+        """
+        row = self.row_by_id.get(id)
+        if row is None:
+            if self.size == len(self.ids):
+                capacity = max(1, 2 * len(self.ids))
+                data = np.zeros((capacity, len(self.columns)), dtype=np.float32)
+                data[:self.size] = self.data[:self.size]
+                ids = np.zeros(capacity, dtype=np.int64)
+                ids[:self.size] = self.ids[:self.size]
+                self.data = data
+                self.ids = ids
+            row = self.size
+            self.size += 1
+            self.row_by_id[id] = row
+            self.ids[row] = id
+            self.sorted_ids = None
+        self.data[row] = features
+
+
+    def remove(self, id):
+        row = self.row_by_id.pop(id, None)
+        if row is None:
+            return
+        last = self.size - 1
+        if row != last:
+            self.data[row] = self.data[last]
+            self.ids[row] = self.ids[last]
+            self.row_by_id[int(self.ids[row])] = row
+        self.size = last
+        self.sorted_ids = None
+
+
+    def rows(self, ids):
+        """ Returns the row indexes of a list (or array) of ids.
+            Raises KeyError for unknown ids.
+        """
+        if len(ids) < 64:
+            # Few ids: hash lookups are faster
+            return np.array([self.row_by_id[int(id)] for id in ids], dtype=np.int64)
+
+        # Many ids: binary search in the sorted ids (a vectorized join)
+        if self.sorted_ids is None:
+            order = np.argsort(self.ids[:self.size], kind="mergesort")
+            self.sorted_ids = self.ids[:self.size][order]
+            self.sorted_rows = order
+
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.searchsorted(self.sorted_ids, ids)
+        positions = np.minimum(positions, max(0, self.size - 1))
+        if self.size == 0:
+            found = np.zeros(len(ids), dtype=bool)
+        else:
+            found = self.sorted_ids[positions] == ids
+        if not found.all():
+            raise KeyError(int(ids[np.argmin(found)]))
+        return self.sorted_rows[positions]
+
+
+    def gather(self, ids):
+        """ Returns the features of a list of ids (one row per id).
+        """
+        return self.data[self.rows(ids)]
+
+
+    def load(self, ids, data):
+        """ Replaces the whole table (ex: when loading it from disk).
+        """
+        self.size = len(ids)
+        self.ids = np.array(ids, dtype=np.int64)
+        self.data = np.array(data, dtype=np.float32).reshape(self.size, len(self.columns))
+        self.row_by_id = dict((int(self.ids[row]), row) for row in range(self.size))
+        self.sorted_ids = None
+
+
+class FeatureStore(object):
+    """ Contact and agent features for the ranking network.
+        Contact features: id, age, GPS coordinates (latitude and longitude of the postal code).
+        Agent features: id and one skill per supported language.
+        Features are refreshed when the CRM or the agents change, and are saved
+        to disk with the postal code they were geocoded for, so the coordinates
+        don't need to be looked up again on restart. Incremental refreshes are
+        not saved automatically (call save()).
+        Every sync (ex: on load) rebuilds the rows from the current contacts and
+        agents; coordinates are only looked up again for new contacts, contacts
+        whose postal code changed and contacts whose geocoding failed (so the
+        lookup is tried again once the geocoding cache lets it, see Geocoding).
+    """
+
+    def __init__(self, crm, agents, languages=("en", "es"), filename="features.npz"):
+        self.crm = crm
+        self.agents = agents
+        self.languages = list(languages)
+        self.filename = filename
+
+        self.contacts = FeatureTable(["contact id", "age", "latitude", "longitude"])
+        self.agent_features = FeatureTable(["agent id"] + self.languages)
+
+        # Contacts with no coordinates yet, and the postal code of the coordinates of each contact
+        self.failed_contact_ids = set()
+        self.postal_codes = {}
+
+        # Number of columns returned by get_contact_features and get_agent_features
+        self.contact_feature_size = len(self.contacts.columns)
+        self.agent_feature_size = 2
+
+        if not self.filename is None and os.path.exists(self.filename):
+            self.load()
+        self.sync()
+
+        # Keep the features up to date
+        self.crm.add_listener(self.refresh_contact)
+        self.agents.add_listener(self.refresh_agent)
+
+
+    def build_contact_features(self, contact):
+        # GPS coordinates are cached by postal code (see Geocoding)
+        found, coordinates = find_GPS_coordinates(contact["postal code"])
+        self.postal_codes[contact["contact id"]] = contact["postal code"]
+        if found:
+            self.failed_contact_ids.discard(contact["contact id"])
+        else:
+            self.failed_contact_ids.add(contact["contact id"])
+        return [contact["contact id"], contact["age"]] + coordinates
+
+
+    def build_agent_features(self, agent):
+        return [agent["agent id"]] + [agent.get(language, 0.0) for language in self.languages]
+
+
+    def refresh_contact(self, contact_id=None):
+        """ Recomputes the features of a contact (or of all of them if contact_id is None).
+        """
+        if contact_id is None:
+            self.sync(refresh=True)
+            return
+        contact = self.crm.get_contact_by_id(contact_id)
+        if contact is None:
+            self.contacts.remove(contact_id)
+            self.failed_contact_ids.discard(contact_id)
+            self.postal_codes.pop(contact_id, None)
+        else:
+            self.contacts.set(contact_id, self.build_contact_features(contact))
+
+
+    def refresh_agent(self, agent_id=None):
+        """ Recomputes the features of an agent (or of all of them if agent_id is None).
+        """
+        if agent_id is None:
+            self.sync(refresh=True)
+            return
+        agent = self.agents.get_agent_by_id(agent_id)
+        if agent is None:
+            self.agent_features.remove(agent_id)
+        else:
+            self.agent_features.set(agent_id, self.build_agent_features(agent))
+
+
+    def sync(self, refresh=False):
+        """ Rebuilds the features of every contact and agent from their current records
+            and removes the deleted ones. Coordinates are kept unless the contact is new,
+            its postal code changed or its geocoding failed.
+            With refresh=True, the coordinates of every contact are looked up again.
+            Saves the store if anything changed.
+        """
+        changed = False
+
+        for contact in self.crm.contacts:
+            contact_id = contact["contact id"]
+            if refresh or not contact_id in self.contacts or contact_id in self.failed_contact_ids \
+                    or self.postal_codes.get(contact_id) != contact["postal code"]:
+                features = self.build_contact_features(contact)
+            else:
+                coordinates = self.contacts.gather([contact_id])[0, 2:4].tolist()
+                features = [contact_id, contact["age"]] + coordinates
+            changed = self.set_if_changed(self.contacts, contact_id, features) or changed
+        for contact_id in list(self.contacts.row_by_id):
+            if self.crm.get_contact_by_id(contact_id) is None:
+                self.contacts.remove(contact_id)
+                self.failed_contact_ids.discard(contact_id)
+                self.postal_codes.pop(contact_id, None)
+                changed = True
+
+        for agent in self.agents.agents:
+            changed = self.set_if_changed(self.agent_features, agent["agent id"], self.build_agent_features(agent)) or changed
+        for agent_id in list(self.agent_features.row_by_id):
+            if self.agents.get_agent_by_id(agent_id) is None:
+                self.agent_features.remove(agent_id)
+                changed = True
+
+        if changed and not self.filename is None:
+            self.save()
+
+
+    def set_if_changed(self, table, id, features):
+        """ Sets the features of an id in a table. Returns False if they were already set.
+        """
+        features = np.array(features, dtype=np.float32)
+        if id in table and np.array_equal(table.gather([id])[0], features):
+            return False
+        table.set(id, features)
+        return True
+
+
+    def save(self):
+        contact_ids = self.contacts.ids[:self.contacts.size]
+        np.savez(self.filename,
+                 contact_ids=contact_ids,
+                 contact_features=self.contacts.data[:self.contacts.size],
+                 postal_codes=np.array([self.postal_codes.get(int(id), "") for id in contact_ids], dtype=str),
+                 agent_ids=self.agent_features.ids[:self.agent_features.size],
+                 agent_features=self.agent_features.data[:self.agent_features.size],
+                 failed_contact_ids=np.array(sorted(self.failed_contact_ids), dtype=np.int64),
+                 languages=np.array(self.languages))
+
+
+    def load(self):
+        try:
+            with np.load(self.filename) as data:
+                if list(data["languages"]) != self.languages:
+                    print("Features in {} were built for other languages, rebuilding".format(self.filename))
+                    return
+                self.contacts.load(data["contact_ids"], data["contact_features"])
+                self.agent_features.load(data["agent_ids"], data["agent_features"])
+                if "failed_contact_ids" in data.files:
+                    failed_contact_ids = data["failed_contact_ids"]
+                else:
+                    # Saved before failures were recorded: failed lookups have no coordinates
+                    coordinates = self.contacts.data[:self.contacts.size, 2:4]
+                    failed_contact_ids = self.contacts.ids[:self.contacts.size][np.all(coordinates == 0., axis=1)]
+                self.failed_contact_ids = set(int(id) for id in failed_contact_ids)
+                if "postal_codes" in data.files:
+                    # Older files don't have them: their coordinates are looked up again (in the cache)
+                    self.postal_codes = dict(zip(self.contacts.ids[:self.contacts.size].tolist(), data["postal_codes"].tolist()))
+        except Exception as e:
+            print("Error loading features from {0}: {1}".format(self.filename, e))
+
+
+    def get_contact_features(self, contact_ids):
+        """ Returns the features of some contacts (one row per contact id).
+        """
+        return self.contacts.gather(contact_ids)
+
+
+    def get_agent_features(self, agent_ids, languages):
+        """ Returns the features of some agents for the interaction languages:
+            one row per agent with its id and its skill for that language
+            (0 if the language is not supported).
+            'languages' is either one language for all the rows or one per row.
+        """
+        features = np.zeros((len(agent_ids), 2), dtype=np.float32)
+        rows = self.agent_features.rows(agent_ids)
+        features[:, 0] = self.agent_features.data[rows, 0]
+
+        if isinstance(languages, str):
+            if languages in self.languages:
+                features[:, 1] = self.agent_features.data[rows, 1 + self.languages.index(languages)]
+        else:
+            # One language per row: pick the matching skill column of each row
+            unique_languages, codes = np.unique(np.asarray(languages), return_inverse=True)
+            columns = np.array([1 + self.languages.index(language) if language in self.languages else -1
+                                for language in unique_languages], dtype=np.int64)[codes.ravel()]
+            supported = columns >= 0
+            features[supported, 1] = self.agent_features.data[rows[supported], columns[supported]]
+        return features
@@ -5,15 +5,68 @@
 # -----------------------------------------------------
 
 # Dependencies
-import requests             # Installation: pip3 install requests==2.18.4
+import HttpClient           # Shared HTTP client (connection pooling, timeouts and retries)
 from pprint import pprint
+from Cache import SQLiteCache
 
 
 geocode_base_url = "https://maps.googleapis.com/maps/api/geocode/json"
 
+# Coordinates already found, by address (postal codes repeat a lot).
+# Kept on disk, so they survive restarts and are shared between processes.
+# Failed lookups are cached too, for a shorter time, so they are retried later.
+geocoding_cache_file = "geocoding_cache.db"
+geocoding_cache_ttl = 90*24*3600
+geocoding_failure_ttl = 3600
+geocoding_cache = None
 
-def get_GPS_coordinates(address, verbose=False):
-    """ Returns approximate coordinates (lat, long) for a given address (can be a postal code). 
+
+def get_geocoding_cache():
+    global geocoding_cache
+    if geocoding_cache is None:
+        geocoding_cache = SQLiteCache(geocoding_cache_file, "coordinates", geocoding_cache_ttl)
+    return geocoding_cache
+
+
+def get_GPS_coordinates(address, verbose=False, use_cache=True):
+    """ Returns approximate coordinates (lat, long) for a given address (can be a postal code).
+        Results are cached (see geocoding_cache_file); [0.0, 0.0] is returned
+        if the address could not be found.
+    """
+    return find_GPS_coordinates(address, verbose, use_cache)[1]
+
+
+def find_GPS_coordinates(address, verbose=False, use_cache=True):
+    """ Same as get_GPS_coordinates, but returns (success, coordinates), so callers
+        that keep the coordinates can tell a failed lookup and try again later.
+    """
+    if not use_cache:
+        return request_GPS_coordinates(address, verbose)
+
+    cache = get_geocoding_cache()
+    key = " ".join(address.upper().split())
+
+    found, coordinates = cache.get(key)
+    if found:
+        if verbose:
+            print("get_GPS_coordinates returning cached '{}'".format(coordinates))
+        if coordinates is None:
+            # Known failure
+            return False, [0.0, 0.0]
+        return True, coordinates
+
+    success, coordinates = request_GPS_coordinates(address, verbose)
+    if success:
+        cache.set(key, coordinates)
+    else:
+        cache.set(key, None, geocoding_failure_ttl)
+
+    return success, coordinates
+
+
+def request_GPS_coordinates(address, verbose=False):
+    """ Returns (success, coordinates), where coordinates are the approximate (lat, long)
+        for a given address (can be a postal code), or [0.0, 0.0] if not found.
         Uses Google Maps Geocoding API: https://developers.google.com/maps/documentation/geocoding/intro?csw=1
     """
 
@@ -23,21 +76,23 @@ def get_GPS_coordinates(address, verbose=False):
         'key': 'Replace by your API key',
     }
 
-    response = requests.get(geocode_base_url, headers={}, params=params)
-    results = response.json()
-    
     ret = [0.0, 0.0]
+    success = False
+    results = None
 
-    try:         
+    try:
+        response = HttpClient.get(geocode_base_url, headers={}, params=params)
+        results = response.json()
         if len(results["results"]) > 0:
             location = results["results"][0]["geometry"]["location"]
             ret = [location["lat"], location["lng"]]
+            success = True
     except Exception as e:
         print("Error in get_GPS_coordinates: {}".format(e))
 
     if verbose:
         print("Google Maps Geocoding API return for input '{}':".format(address))
-        pprint(results)        
+        pprint(results)
         print("get_GPS_coordinates returning '{}'".format(ret))
 
-    return ret
+    return success, ret
@@ -0,0 +1,95 @@
+# -----------------------------------------------------
+# HttpClient module by Ricardo Santos.
+# Shared HTTP client for all the APIs used by the bot
+# (Facebook, Microsoft Text Analytics and LUIS, Google
+# Maps). Reuses connections (keep-alive), applies
+# timeouts and retries failed calls.
+# -----------------------------------------------------
+
+# Dependencies
+import os
+import time
+import random
+import threading
+import requests             # Installation: pip3 install requests==2.18.4
+from requests.adapters import HTTPAdapter
+
+
+# Connection pool: number of hosts kept and connections kept per host
+pool_connections = 10
+pool_maxsize = 32
+
+# Seconds to wait for a connection and for a response
+connect_timeout = 3.05
+read_timeout = 10.0
+
+# Failed calls are retried up to max_retries times, waiting a random time
+# between 0 and backoff_factor * 2^attempt seconds (capped at max_backoff)
+max_retries = 3
+backoff_factor = 0.2
+max_backoff = 5.0
+retry_status_codes = (429, 500, 502, 503, 504)
+
+session = None
+session_pid = None
+session_lock = threading.Lock()
+
+
+def get_session():
+    """ Returns the shared session (created on first use).
+        A session keeps the TCP/TLS connections open between calls.
+        Each process has its own (connections can't be shared after a fork).
+    """
+    global session, session_pid
+    if session is None or session_pid != os.getpid():
+        with session_lock:
+            if session is None or session_pid != os.getpid():
+                new_session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+                new_session.mount("https://", adapter)
+                new_session.mount("http://", adapter)
+                session = new_session
+                session_pid = os.getpid()
+    return session
+
+
+def backoff_delay(attempt):
+    """ Full jitter: a random delay, so clients don't retry all at the same time.
+    """
+    return random.uniform(0, min(max_backoff, backoff_factor * (2 ** attempt)))
+
+
+def request(method, url, idempotent=True, retries=None, **kwargs):
+    """ Sends a request with the shared session.
+        Connection errors, timeouts and the status codes in retry_status_codes
+        are retried. For calls that must not be repeated once received
+        (idempotent=False, ex: sending a message) only connection timeouts
+        are retried, since the request was never sent.
+        Accepts the same keyword arguments as requests.request.
+    """
+    if retries is None:
+        retries = max_retries
+    kwargs.setdefault("timeout", (connect_timeout, read_timeout))
+
+    attempt = 0
+    while True:
+        try:
+            response = get_session().request(method, url, **kwargs)
+            if not idempotent or not response.status_code in retry_status_codes or attempt >= retries:
+                return response
+            print("HTTP {0} from {1}, retrying".format(response.status_code, url))
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt >= retries or (not idempotent and not isinstance(e, requests.exceptions.ConnectTimeout)):
+                raise
+            print("Error calling {0} ({1}), retrying".format(url, e))
+
+        time.sleep(backoff_delay(attempt))
+        attempt += 1
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
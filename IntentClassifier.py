@@ -0,0 +1,216 @@
+# -----------------------------------------------------
+# IntentClassifier module by Ricardo Santos.
+# Local (offline) intent classifier: TF-IDF features
+# and a linear (softmax regression) model, in NumPy.
+# Used before calling Microsoft LUIS, which is only
+# needed when the local guess is not confident.
+#
+# Usage: python3 IntentClassifier.py
+# (evaluates the classifier on the bundled samples)
+# -----------------------------------------------------
+
+# Dependencies
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+
+
+# Bundled training data: labelled customer messages ("sales", "support" or "other") per language
+intent_samples = {
+    "en": [
+        ("I want to buy a new fridge", "sales"),
+        ("I would like to buy a washing machine", "sales"),
+        ("how much does this oven cost", "sales"),
+        ("what is the price of the dishwasher", "sales"),
+        ("do you have any discounts on microwaves", "sales"),
+        ("I'm interested in your new vacuum cleaner", "sales"),
+        ("can I order a dryer online", "sales"),
+        ("which fridge would you recommend for a family of four", "sales"),
+        ("is the new model available in white", "sales"),
+        ("do you sell coffee machines", "sales"),
+        ("I want to purchase two air conditioners", "sales"),
+        ("are there any offers this week", "sales"),
+        ("can I pay in installments", "sales"),
+        ("I'd like a quote for a kitchen set", "sales"),
+        ("what models of televisions do you have", "sales"),
+        ("my washing machine is broken", "support"),
+        ("the fridge is not working properly", "support"),
+        ("I have a problem with my dryer", "support"),
+        ("it makes a strange noise when it starts", "support"),
+        ("the oven does not heat up", "support"),
+        ("I need help with my dishwasher, it leaks water", "support"),
+        ("my microwave stopped working", "support"),
+        ("the warranty should cover the repair", "support"),
+        ("how do I clean the filter", "support"),
+        ("the display shows an error code", "support"),
+        ("can you send a technician to fix it", "support"),
+        ("I can't turn on the vacuum cleaner", "support"),
+        ("the air conditioner is leaking", "support"),
+        ("I lost the manual, how do I reset it", "support"),
+        ("the door of the fridge doesn't close", "support"),
+        ("hello", "other"),
+        ("hi there", "other"),
+        ("good morning", "other"),
+        ("thank you", "other"),
+        ("thanks a lot", "other"),
+        ("bye", "other"),
+        ("what's the weather like today", "other"),
+        ("who are you", "other"),
+        ("are you a robot", "other"),
+        ("tell me a joke", "other"),
+        ("ok", "other"),
+        ("nice to meet you", "other"),
+    ],
+    "es": [
+        ("quiero comprar una nevera nueva", "sales"),
+        ("me gustaría comprar una lavadora", "sales"),
+        ("cuánto cuesta este horno", "sales"),
+        ("cuál es el precio del lavavajillas", "sales"),
+        ("tienen algún descuento en microondas", "sales"),
+        ("me interesa la nueva aspiradora", "sales"),
+        ("puedo pedir una secadora por internet", "sales"),
+        ("qué nevera me recomienda para una familia de cuatro", "sales"),
+        ("el nuevo modelo está disponible en blanco", "sales"),
+        ("venden cafeteras", "sales"),
+        ("quiero comprar dos aires acondicionados", "sales"),
+        ("hay alguna oferta esta semana", "sales"),
+        ("puedo pagar a plazos", "sales"),
+        ("quiero un presupuesto para una cocina", "sales"),
+        ("qué modelos de televisores tienen", "sales"),
+        ("mi lavadora está rota", "support"),
+        ("la nevera no funciona bien", "support"),
+        ("tengo un problema con mi secadora", "support"),
+        ("hace un ruido extraño cuando arranca", "support"),
+        ("el horno no calienta", "support"),
+        ("necesito ayuda con el lavavajillas, pierde agua", "support"),
+        ("mi microondas dejó de funcionar", "support"),
+        ("la garantía debería cubrir la reparación", "support"),
+        ("cómo limpio el filtro", "support"),
+        ("la pantalla muestra un código de error", "support"),
+        ("pueden enviar un técnico para arreglarlo", "support"),
+        ("no puedo encender la aspiradora", "support"),
+        ("el aire acondicionado gotea", "support"),
+        ("perdí el manual, cómo lo reinicio", "support"),
+        ("la puerta de la nevera no cierra", "support"),
+        ("hola", "other"),
+        ("buenas", "other"),
+        ("buenos días", "other"),
+        ("gracias", "other"),
+        ("muchas gracias", "other"),
+        ("adiós", "other"),
+        ("qué tiempo hace hoy", "other"),
+        ("quién eres", "other"),
+        ("eres un robot", "other"),
+        ("cuéntame un chiste", "other"),
+        ("vale", "other"),
+        ("encantado de conocerte", "other"),
+    ],
+}
+
+
+def tokenize(text):
+    """ Lower case words (letters and digits only) and pairs of consecutive words.
+    """
+    text = "".join(c if c.isalnum() else " " for c in text.lower())
+    words = text.split()
+    return words + [words[i] + " " + words[i + 1] for i in range(len(words) - 1)]
+
+
+class IntentClassifier(object):
+    """ Classifies a text in one of the intents of the training samples.
+        Texts are represented as L2-normalized TF-IDF vectors of words and word pairs,
+        and a softmax regression is trained on them with full-batch gradient descent.
+    """
+
+    def __init__(self, samples, iterations=300, learning_rate=2.0, regularization=1e-3):
+        self.iterations = iterations
+        self.learning_rate = learning_rate
+        self.regularization = regularization
+        self.train(samples)
+
+
+    def train(self, samples):
+        """ Trains the classifier with a list of (text, intent) pairs.
+        """
+        texts = [text for text, intent in samples]
+        self.intents = sorted(set(intent for text, intent in samples))
+
+        # Vocabulary and inverse document frequencies
+        self.vocabulary = {}
+        document_frequencies = []
+        for text in texts:
+            for token in set(tokenize(text)):
+                if not token in self.vocabulary:
+                    self.vocabulary[token] = len(self.vocabulary)
+                    document_frequencies.append(0)
+                document_frequencies[self.vocabulary[token]] += 1
+        self.idf = np.log((1.0 + len(texts)) / (1.0 + np.array(document_frequencies, dtype=np.float32))) + 1.0
+
+        x = self.transform(texts)
+        y = np.zeros((len(samples), len(self.intents)), dtype=np.float32)
+        for i in range(len(samples)):
+            y[i, self.intents.index(samples[i][1])] = 1.0
+
+        # Softmax regression (cross-entropy loss with L2 regularization)
+        self.weights = np.zeros((x.shape[1], len(self.intents)), dtype=np.float32)
+        self.bias = np.zeros(len(self.intents), dtype=np.float32)
+        for iteration in range(self.iterations):
+            error = (self.softmax(np.dot(x, self.weights) + self.bias) - y) / len(samples)
+            self.weights -= self.learning_rate * (np.dot(x.T, error) + self.regularization * self.weights)
+            self.bias -= self.learning_rate * np.sum(error, axis=0)
+
+
+    def transform(self, texts):
+        """ Returns the TF-IDF vectors of some texts (one row per text).
+        """
+        x = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        for i in range(len(texts)):
+            for token in tokenize(texts[i]):
+                column = self.vocabulary.get(token)
+                if not column is None:
+                    x[i, column] += 1.0
+        x *= self.idf
+        norms = np.sqrt(np.sum(x * x, axis=1, keepdims=True))
+        return x / np.maximum(norms, 1e-12)
+
+
+    def softmax(self, scores):
+        scores = np.exp(scores - np.max(scores, axis=1, keepdims=True))
+        return scores / np.sum(scores, axis=1, keepdims=True)
+
+
+    def predict_probabilities(self, texts):
+        """ Returns the probability of every intent (columns in self.intents) for some texts.
+            A text with no known words gets the same probability for every intent.
+        """
+        x = self.transform(texts)
+        probabilities = self.softmax(np.dot(x, self.weights) + self.bias)
+        unknown = np.sum(x, axis=1) == 0
+        probabilities[unknown] = 1.0 / len(self.intents)
+        return probabilities
+
+
+    def predict(self, text):
+        """ Returns (intent, confidence) for a text.
+        """
+        probabilities = self.predict_probabilities([text])[0]
+        best = int(np.argmax(probabilities))
+        return self.intents[best], float(probabilities[best])
+
+
+def evaluate(samples, folds=5):
+    """ Cross-validated accuracy of the classifier on a list of (text, intent) pairs.
+    """
+    order = np.random.RandomState(0).permutation(len(samples))
+    correct = 0
+    for fold in range(folds):
+        test = set(order[fold::folds])
+        classifier = IntentClassifier([samples[i] for i in range(len(samples)) if not i in test])
+        for i in test:
+            if classifier.predict(samples[i][0])[0] == samples[i][1]:
+                correct += 1
+    return float(correct) / len(samples)
+
+
+if __name__ == '__main__':
+    for language in sorted(intent_samples):
+        print("{0}: {1} samples, cross-validated accuracy {2:.2f}".format(
+            language, len(intent_samples[language]), evaluate(intent_samples[language])))
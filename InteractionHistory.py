@@ -0,0 +1,115 @@
+# -----------------------------------------------------
+# InteractionHistory module by Ricardo Santos.
+# Reads and writes the history of interactions
+# (used to train the ranking network) from files,
+# in chunks, so it never has to fit in memory.
+# Supported formats: CSV, JSON lines and a directory
+# with one .npy file per column (memory-mapped).
+# -----------------------------------------------------
+
+# Dependencies
+import os
+import csv
+import json
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+
+
+# Fields of an interaction and the type of their columns
+history_fields = [
+    ("contact id", np.int64),
+    ("handled by", np.int64),
+    ("language", str),
+    ("sentiment", np.float32),
+    ("category", str),
+    ("score", np.float32)]
+
+
+def rows_to_columns(rows):
+    """ Converts a list of interactions (dicts) to columns (numpy arrays).
+    """
+    columns = {}
+    for field, dtype in history_fields:
+        columns[field] = np.array([row[field] for row in rows], dtype=dtype)
+    return columns
+
+
+def column_file(directory, field):
+    return os.path.join(directory, field.replace(" ", "_") + ".npy")
+
+
+def is_columnar(filename):
+    return os.path.isdir(filename)
+
+
+def write_history(filename, rows):
+    """ Writes interactions (dicts) to a file.
+            .csv   -> CSV with a header line
+            .jsonl -> one JSON object per line
+            other  -> directory with one .npy file per column
+    """
+    if filename.endswith(".csv"):
+        with open(filename, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=[field for field, dtype in history_fields])
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+    elif filename.endswith(".jsonl"):
+        with open(filename, "w") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+    else:
+        if not os.path.isdir(filename):
+            os.makedirs(filename)
+        columns = rows_to_columns(list(rows))
+        for field, dtype in history_fields:
+            np.save(column_file(filename, field), columns[field])
+
+
+def read_history_rows(filename):
+    """ Yields the interactions (dicts) of a CSV or JSON lines file.
+    """
+    if filename.endswith(".csv"):
+        with open(filename, newline="") as f:
+            for row in csv.DictReader(f):
+                yield row
+    else:
+        with open(filename) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_history_chunks(filename, chunk_size=100000):
+    """ Yields the history of a file in chunks of up to 'chunk_size' interactions.
+        Each chunk is a dict of columns (see CRM.get_history_columns).
+    """
+    if is_columnar(filename):
+        # Memory-mapped columns: only the slices being read are loaded
+        columns = {}
+        for field, dtype in history_fields:
+            columns[field] = np.load(column_file(filename, field), mmap_mode="r")
+        size = len(columns["score"])
+        for start in range(0, size, chunk_size):
+            yield dict((field, np.array(column[start:start + chunk_size])) for field, column in columns.items())
+        return
+
+    rows = []
+    for row in read_history_rows(filename):
+        rows.append(row)
+        if len(rows) == chunk_size:
+            yield rows_to_columns(rows)
+            rows = []
+    if len(rows) > 0:
+        yield rows_to_columns(rows)
+
+
+def count_history_rows(filename):
+    """ Returns the number of interactions in a history file.
+    """
+    if is_columnar(filename):
+        return len(np.load(column_file(filename, "score"), mmap_mode="r"))
+
+    count = 0
+    for row in read_history_rows(filename):
+        count += 1
+    return count
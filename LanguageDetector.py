@@ -0,0 +1,124 @@
+# -----------------------------------------------------
+# LanguageDetector module by Ricardo Santos.
+# Local (offline) detector for the languages supported
+# by the bot, based on character n-grams.
+# Used before calling the Microsoft Language API, which
+# is only needed when the local guess is not confident.
+# -----------------------------------------------------
+
+# Dependencies
+import math
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+
+
+# Bundled training data: typical customer messages in each supported language
+language_samples = {
+    "en": [
+        "hi", "hello", "hey", "hi there", "hello there", "good morning", "good afternoon",
+        "good evening", "hey there how are you", "hi how are you doing today",
+        "thanks", "thank you very much", "thanks a lot for your help", "yes please", "no thanks",
+        "my customer number is 1", "my number is 2", "I want to buy a new fridge",
+        "I would like to buy a washing machine", "how much does this oven cost",
+        "what is the price of the dishwasher", "do you have any discounts on microwaves",
+        "I need help with my order", "my washing machine is broken",
+        "the fridge is not working properly", "can you help me please",
+        "I have a problem with my dryer", "it makes a strange noise when it starts",
+        "where is my delivery", "when will my order arrive", "I want to return this product",
+        "the warranty should cover the repair", "I would like to talk to someone",
+        "please call me back as soon as possible", "this is the worst service ever",
+        "I am very happy with the new vacuum cleaner", "could you send me the manual",
+        "is there a store near my house", "I bought it last week and it already stopped working",
+        "which model would you recommend for a small kitchen", "how do I clean the filter",
+    ],
+    "es": [
+        "hola", "buenas", "buenos días", "buenas tardes", "buenas noches", "hola qué tal",
+        "hola cómo estás", "hola buenos días cómo está usted", "gracias", "muchas gracias",
+        "muchas gracias por su ayuda", "sí por favor", "no gracias",
+        "mi número de cliente es 1", "mi número es 2", "quiero comprar una nevera nueva",
+        "me gustaría comprar una lavadora", "cuánto cuesta este horno",
+        "cuál es el precio del lavavajillas", "tienen algún descuento en microondas",
+        "necesito ayuda con mi pedido", "mi lavadora está rota",
+        "la nevera no funciona bien", "me puede ayudar por favor",
+        "tengo un problema con mi secadora", "hace un ruido extraño cuando arranca",
+        "dónde está mi entrega", "cuándo llegará mi pedido", "quiero devolver este producto",
+        "la garantía debería cubrir la reparación", "me gustaría hablar con alguien",
+        "por favor llámeme lo antes posible", "es el peor servicio que he visto",
+        "estoy muy contento con la nueva aspiradora", "me podría enviar el manual",
+        "hay alguna tienda cerca de mi casa", "lo compré la semana pasada y ya dejó de funcionar",
+        "qué modelo me recomienda para una cocina pequeña", "cómo limpio el filtro",
+        "me ayudas", "qué tal todo",
+    ],
+}
+
+
+class LanguageDetector(object):
+    """ Naive Bayes classifier over character n-grams (1 to 3 characters).
+        detect returns the most likely language and a confidence (0 to 1):
+        the posterior probability of that language, reduced when most of the
+        n-grams of the text were never seen in the training data
+        (ex: a text in a language that is not supported).
+    """
+
+    def __init__(self, samples=None, max_ngram=3, smoothing=0.5):
+        if samples is None:
+            samples = language_samples
+        self.max_ngram = max_ngram
+        self.languages = sorted(samples)
+
+        # Counts of every n-gram in every language
+        counts = {}
+        for i in range(len(self.languages)):
+            for text in samples[self.languages[i]]:
+                for ngram in self.get_ngrams(text):
+                    if not ngram in counts:
+                        counts[ngram] = np.zeros(len(self.languages))
+                    counts[ngram][i] += 1
+
+        # log P(ngram | language), with additive smoothing
+        totals = np.sum(list(counts.values()), axis=0) + smoothing * (len(counts) + 1)
+        self.log_probabilities = {}
+        for ngram, ngram_counts in counts.items():
+            self.log_probabilities[ngram] = np.log((ngram_counts + smoothing) / totals)
+        self.unknown_log_probability = np.log(smoothing / totals)
+
+        # log P(language): uniform, the bot does not favour any language
+        self.log_priors = np.full(len(self.languages), -math.log(len(self.languages)))
+
+
+    def get_ngrams(self, text):
+        # Only letters count (digits and punctuation are the same in every language)
+        text = "".join(c if c.isalpha() else " " for c in text.lower())
+        text = " " + " ".join(text.split()) + " "
+        ngrams = []
+        for n in range(1, self.max_ngram + 1):
+            for i in range(len(text) - n + 1):
+                ngram = text[i:i + n]
+                if ngram != " ":
+                    ngrams.append(ngram)
+        return ngrams
+
+
+    def detect(self, text):
+        """ Returns (language, confidence) for a text.
+        """
+        ngrams = self.get_ngrams(text)
+        if len(ngrams) == 0:
+            return self.languages[0], 0.0
+
+        scores = self.log_priors.copy()
+        known = 0
+        for ngram in ngrams:
+            log_probability = self.log_probabilities.get(ngram)
+            if log_probability is None:
+                scores += self.unknown_log_probability
+            else:
+                scores += log_probability
+                known += 1
+
+        # Posterior probabilities (softmax of the scores)
+        probabilities = np.exp(scores - np.max(scores))
+        probabilities /= np.sum(probabilities)
+
+        best = int(np.argmax(probabilities))
+        coverage = float(known) / len(ngrams)
+        return self.languages[best], float(probabilities[best]) * coverage
@@ -0,0 +1,95 @@
+# -----------------------------------------------------
+# MessageWorkers module by Ricardo Santos.
+# Pool of worker threads that handle the user messages
+# in the background, so the webhook can acknowledge
+# Facebook immediately.
+# -----------------------------------------------------
+
+# Dependencies
+import time
+import queue
+import threading
+
+
+class MessageWorkers(object):
+    """ Handles messages with a pool of worker threads, each one with its own bounded queue.
+        Messages from the same user always go to the same worker, so they are
+        handled one at a time and in order; messages from different users are
+        handled concurrently.
+        When the queue of a worker is full, submit waits up to 'submit_timeout'
+        seconds and then gives up (backpressure: the caller should ask the
+        sender to retry later). A batch of messages is queued as a whole or
+        not at all, so a retried batch is not handled twice.
+    """
+
+    def __init__(self, handle_message, number_of_workers=8, queue_size=100, submit_timeout=0.5):
+        self.handle_message = handle_message
+        self.submit_timeout = submit_timeout
+        self.queues = [queue.Queue(maxsize=queue_size) for i in range(number_of_workers)]
+        self.workers = []
+        self.lock = threading.Lock()
+        self.submit_lock = threading.Lock()
+
+
+    def start(self):
+        """ Starts the worker threads (done on the first submit).
+        """
+        with self.lock:
+            if len(self.workers) == 0:
+                for i in range(len(self.queues)):
+                    worker = threading.Thread(target=self.run, args=(self.queues[i],), name="MessageWorker-{}".format(i))
+                    worker.daemon = True
+                    worker.start()
+                    self.workers.append(worker)
+
+
+    def submit(self, recipient_id, text):
+        """ Queues a message to be handled by handle_message(recipient_id, text).
+            Returns False if the queue stayed full for submit_timeout seconds.
+        """
+        return self.submit_batch([(recipient_id, text)])
+
+
+    def submit_batch(self, messages):
+        """ Queues a list of (recipient id, text) messages, all of them or none:
+            returns False, with nothing queued, if the queues did not have room
+            for the whole batch within submit_timeout seconds.
+        """
+        if len(self.workers) == 0:
+            self.start()
+
+        messages_by_queue = [[] for i in range(len(self.queues))]
+        for recipient_id, text in messages:
+            messages_by_queue[hash(recipient_id) % len(self.queues)].append((recipient_id, text))
+
+        deadline = time.time() + self.submit_timeout
+        while True:
+            with self.submit_lock:
+                # Only submitters fill the queues, so the room found here can't be taken meanwhile
+                if all(worker_queue.maxsize - worker_queue.qsize() >= len(batch)
+                       for worker_queue, batch in zip(self.queues, messages_by_queue)):
+                    for worker_queue, batch in zip(self.queues, messages_by_queue):
+                        for message in batch:
+                            worker_queue.put_nowait(message)
+                    return True
+            if time.time() >= deadline:
+                print("Message queue full, rejecting {} messages".format(len(messages)))
+                return False
+            time.sleep(0.01)
+
+
+    def pending(self):
+        """ Number of messages waiting to be handled.
+        """
+        return sum(messages.qsize() for messages in self.queues)
+
+
+    def run(self, messages):
+        while True:
+            recipient_id, text = messages.get()
+            try:
+                self.handle_message(recipient_id, text)
+            except Exception as e:
+                print("Error handling message from {0}: {1}".format(recipient_id, e))
+            finally:
+                messages.task_done()
@@ -0,0 +1,114 @@
+# -----------------------------------------------------
+# MicroBatcher module by Ricardo Santos.
+# Groups small pieces of work submitted by concurrent
+# callers into bigger batches, processes each batch
+# in one call and gives every caller its own results.
+# -----------------------------------------------------
+
+# Dependencies
+import queue
+import threading
+import time
+
+
+class BatchRequest(object):
+    """ Items submitted by one caller, waiting for their results.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher(object):
+    """ Collects the items submitted by concurrent callers over a short window
+        and processes them with a single call to 'process_batch'.
+        A batch is closed when it holds at least 'max_batch_size' items or
+        when 'max_wait' seconds have passed since its first request arrived.
+        'process_batch' receives a list of items and must return a sequence
+        of results of the same length (ex: a numpy array with one row per item).
+    """
+
+    def __init__(self, process_batch, max_batch_size=256, max_wait=0.002):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.pending = queue.Queue()
+        self.worker = None
+        self.lock = threading.Lock()
+
+
+    def start(self):
+        """ Starts the worker thread (done on the first submit).
+        """
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self.run, name="MicroBatcher")
+                self.worker.daemon = True
+                self.worker.start()
+
+
+    def submit(self, items):
+        """ Submits a list of items and blocks until their results are ready.
+            Returns the results for these items only, in the same order.
+        """
+        if len(items) == 0:
+            return self.process_batch(items)
+
+        if self.worker is None:
+            self.start()
+
+        request = BatchRequest(items)
+        self.pending.put(request)
+        request.done.wait()
+
+        if not request.error is None:
+            raise request.error
+        return request.results
+
+
+    def run(self):
+        """ Worker loop: waits for a request, gathers more for up to max_wait
+            seconds (or until the batch is full) and processes them together.
+        """
+        while True:
+            requests = [self.pending.get()]
+            size = len(requests[0].items)
+            deadline = time.monotonic() + self.max_wait
+
+            while size < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.pending.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                size += len(request.items)
+
+            self.run_batch(requests)
+
+
+    def run_batch(self, requests):
+        """ Processes a batch and scatters the results back to the callers.
+        """
+        items = []
+        for request in requests:
+            items.extend(request.items)
+
+        try:
+            results = self.process_batch(items)
+            start = 0
+            for request in requests:
+                request.results = results[start:start + len(request.items)]
+                start += len(request.items)
+        except Exception as e:
+            print("Error in MicroBatcher: {}".format(e))
+            for request in requests:
+                request.error = e
+
+        for request in requests:
+            request.done.set()
@@ -0,0 +1,167 @@
+# -----------------------------------------------------
+# ModelRegistry module by Ricardo Santos.
+# Keeps track of the versions of the ranking weights
+# (weights_v1.h5, weights_v2.h5...) and lets a running
+# bot start using a new version without a restart:
+# new files are loaded and checked in the background,
+# and only then replace the active model.
+# -----------------------------------------------------
+
+# Dependencies
+import os
+import re
+import glob
+import threading
+import time
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+from NumpyRankingModel import NumpyRankingModel
+
+
+class ModelRegistry(object):
+    """ Finds the latest version of a weights file. Versions are saved next to it
+        with a number: "weights.h5" -> "weights_v1.h5", "weights_v2.h5"...
+        (the unversioned file is version 0). A file is also reloaded when it is
+        overwritten (its modification time changes).
+        A watcher thread checks for new versions every 'poll_interval' seconds;
+        a new model is loaded, validated with a smoke prediction and then passed
+        to 'on_change(model, filename)' (called with the lock held, so it must
+        be quick). A model that fails validation is ignored (the active model
+        keeps being used) and the file is not retried until it changes again.
+    """
+
+    def __init__(self, weights_file="weights.h5", input_size=None, on_change=None, poll_interval=30):
+        self.weights_file = weights_file
+        self.input_size = input_size
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+
+        base, extension = os.path.splitext(weights_file)
+        self.version_pattern = base + "_v*" + extension
+        self.version_regex = re.compile(re.escape(base) + r"_v(\d+)" + re.escape(extension) + "$")
+
+        self.active_file = None
+        self.active_key = None      # (version, modification time) of the active file
+        self.rejected_keys = set()
+        self.lock = threading.Lock()
+        self.watcher = None
+
+
+    def get_versions(self):
+        """ Returns a list of (version, filename) of the existing weight files, oldest first.
+        """
+        versions = []
+        if os.path.exists(self.weights_file):
+            versions.append((0, self.weights_file))
+        for filename in glob.glob(self.version_pattern):
+            match = self.version_regex.search(filename)
+            if not match is None:
+                versions.append((int(match.group(1)), filename))
+        return sorted(versions)
+
+
+    def get_latest(self):
+        """ Returns (version, filename) of the latest weights file, or (None, None) if there is none.
+        """
+        versions = self.get_versions()
+        if len(versions) == 0:
+            return None, None
+        return versions[-1]
+
+
+    def get_next_file(self):
+        """ Returns the name of the file where the next version should be saved.
+        """
+        version, filename = self.get_latest()
+        base, extension = os.path.splitext(self.weights_file)
+        return "{0}_v{1}{2}".format(base, 1 if version is None else version + 1, extension)
+
+
+    def get_file_key(self, version, filename):
+        try:
+            return version, os.path.getmtime(filename)
+        except OSError:
+            return None
+
+
+    def load(self, filename):
+        """ Loads a weights file and checks it before it is used:
+            the network must accept the expected input size and give
+            one finite prediction per sample. Raises ValueError otherwise.
+        """
+        model = NumpyRankingModel.load(filename)
+        if not self.input_size is None and model.input_size != self.input_size:
+            raise ValueError("{0} expects {1} inputs instead of {2}".format(
+                filename, model.input_size, self.input_size))
+
+        samples = np.random.RandomState(0).uniform(-1.0, 1.0, (16, model.input_size)).astype(np.float32)
+        samples[0] = 0.0
+        predictions = model.predict(samples)
+        if predictions.shape != (16, 1):
+            raise ValueError("{0} predicts an array with shape {1}".format(filename, predictions.shape))
+        if not np.all(np.isfinite(predictions)):
+            raise ValueError("{} predicts non finite values".format(filename))
+        return model
+
+
+    def load_latest(self):
+        """ Loads the latest version right away (used at start-up).
+            Returns the model, or raises an exception if it can't be loaded.
+        """
+        with self.lock:
+            version, filename = self.get_latest()
+            if filename is None:
+                raise IOError("No weights file found ({})".format(self.weights_file))
+            key = self.get_file_key(version, filename)
+            model = self.load(filename)
+            self.active_file = filename
+            self.active_key = key
+            return model
+
+
+    def check(self):
+        """ Loads and activates the latest version, if it is new.
+            Returns True if the active model was replaced.
+        """
+        with self.lock:
+            version, filename = self.get_latest()
+            if filename is None:
+                return False
+            key = self.get_file_key(version, filename)
+            if key is None or key == self.active_key or key in self.rejected_keys:
+                return False
+
+            try:
+                model = self.load(filename)
+            except Exception as e:
+                print("Weights in {0} rejected: {1}".format(filename, e))
+                self.rejected_keys.add(key)
+                return False
+
+            # Activated under the lock, so concurrent checks can't install an older version last
+            self.active_file = filename
+            self.active_key = key
+            print("Using the weights in {}".format(filename))
+            if not self.on_change is None:
+                self.on_change(model, filename)
+            return True
+
+
+    def start(self):
+        """ Starts the watcher thread (after a fork, each process must start its own).
+        """
+        if self.poll_interval is None or self.poll_interval <= 0:
+            return
+        with self.lock:
+            if self.watcher is None or not self.watcher.is_alive():
+                self.watcher = threading.Thread(target=self.run, name="ModelRegistry")
+                self.watcher.daemon = True
+                self.watcher.start()
+
+
+    def run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.check()
+            except Exception as e:
+                print("Error checking the weights: {}".format(e))
@@ -0,0 +1,85 @@
+# -----------------------------------------------------
+# NumpyRankingModel module by Ricardo Santos.
+# Evaluates the trained ranking network with NumPy only,
+# so the bot can rank agents without importing
+# TensorFlow and Keras.
+# -----------------------------------------------------
+
+# Dependencies
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+import h5py             # Installation: pip3 install h5py==2.8.0
+
+
+# Keras' default BatchNormalization epsilon (not stored in the weights file)
+batch_normalization_epsilon = 1e-3
+
+
+class NumpyRankingModel(object):
+    """ Inference-only version of the network created by RankingNetwork.create_network.
+        Holds a list of dense layers (kernel, bias, activation).
+        BatchNormalization is folded into the dense layer that follows it
+        and Dropout is ignored (it only acts during training), so a
+        prediction is just a few matrix products.
+    """
+
+    def __init__(self, layers):
+        self.layers = layers
+        self.input_size = layers[0][0].shape[0]
+
+
+    @classmethod
+    def load(cls, filename):
+        """ Reads a weights file saved by Keras' model.save_weights.
+            Every dense layer uses a ReLU activation except the last one
+            (linear output), as in RankingNetwork.create_network.
+        """
+        layers = []
+        pending_normalization = None  # (scale, shift) waiting for the next dense layer
+
+        with h5py.File(filename, "r") as f:
+            for layer_name in f.attrs["layer_names"]:
+                group = f[layer_name.decode("utf8") if isinstance(layer_name, bytes) else layer_name]
+                weights = {}
+                for weight_name in group.attrs["weight_names"]:
+                    if isinstance(weight_name, bytes):
+                        weight_name = weight_name.decode("utf8")
+                    # ex: "dense_1/kernel:0" -> "kernel"
+                    short_name = weight_name.split("/")[-1].split(":")[0]
+                    weights[short_name] = np.array(group[weight_name], dtype=np.float32)
+
+                if "kernel" in weights:
+                    kernel = weights["kernel"]
+                    bias = weights.get("bias", np.zeros(kernel.shape[1], dtype=np.float32))
+                    if not pending_normalization is None:
+                        # dense(x * scale + shift) = x . (scale * kernel) + (shift . kernel + bias)
+                        scale, shift = pending_normalization
+                        bias = bias + np.dot(shift, kernel)
+                        kernel = scale[:, np.newaxis] * kernel
+                        pending_normalization = None
+                    layers.append([kernel, bias, "relu"])
+                elif "moving_mean" in weights:
+                    scale = weights["gamma"] / np.sqrt(weights["moving_variance"] + batch_normalization_epsilon)
+                    shift = weights["beta"] - weights["moving_mean"] * scale
+                    pending_normalization = (scale, shift)
+                # Layers without weights (Dropout) do nothing at inference time
+
+        if len(layers) == 0:
+            raise ValueError("No dense layers found in {}".format(filename))
+        if not pending_normalization is None:
+            raise ValueError("BatchNormalization after the output layer is not supported")
+
+        # Linear output
+        layers[-1][2] = "linear"
+
+        return cls([tuple(layer) for layer in layers])
+
+
+    def predict(self, x, batch_size=None):
+        """ Same as Keras' model.predict: one row of output per input sample.
+        """
+        x = np.asarray(x, dtype=np.float32)
+        for kernel, bias, activation in self.layers:
+            x = np.dot(x, kernel) + bias
+            if activation == "relu":
+                x = np.maximum(x, 0.)
+        return x
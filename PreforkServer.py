@@ -0,0 +1,103 @@
+# -----------------------------------------------------
+# PreforkServer module by Ricardo Santos.
+# Serves the bot with several worker processes.
+# Everything heavy (ranking weights, agent skill matrix,
+# contact features...) is loaded once in the master
+# process and shared with the workers, which are forked
+# from it: memory pages are shared copy-on-write, so
+# they are not duplicated as long as nobody writes them.
+# Linux/macOS only (uses os.fork).
+# -----------------------------------------------------
+
+# Dependencies
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+from werkzeug.serving import make_server    # Installed with Flask
+
+
+def create_listening_socket(host, port, backlog=128):
+    """ Creates the socket shared by all the workers (the kernel spreads connections).
+    """
+    listening_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listening_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listening_socket.bind((host, port))
+    listening_socket.listen(backlog)
+    listening_socket.set_inheritable(True)
+    return listening_socket
+
+
+def run_worker(app, host, port, listening_socket):
+    """ Serves requests in a worker process, until it is terminated.
+    """
+    signal.signal(signal.SIGTERM, lambda signum, frame: os._exit(0))
+    server = make_server(host, port, app, threaded=True, fd=listening_socket.fileno())
+    print("Worker {} serving".format(os.getpid()))
+    server.serve_forever()
+
+
+def fork_worker(app, host, port, listening_socket):
+    pid = os.fork()
+    if pid == 0:
+        # Worker process
+        try:
+            run_worker(app, host, port, listening_socket)
+        finally:
+            os._exit(1)
+    return pid
+
+
+def serve(app, preload, host="127.0.0.1", port=5001, number_of_workers=4):
+    """ Calls preload() in this (master) process, then forks number_of_workers
+        workers serving 'app' on the same port. Workers that die are replaced.
+        preload must not start threads: they would not exist in the workers.
+        Data loaded by preload is shared read-only: a change made by one worker
+        is not seen by the others.
+    """
+    print("Preloading in master process {}".format(os.getpid()))
+    preload()
+
+    listening_socket = create_listening_socket(host, port)
+
+    # Objects created so far are never collected: the garbage collector
+    # would otherwise write to their pages and break the sharing
+    if hasattr(gc, "freeze"):
+        gc.collect()
+        gc.freeze()
+
+    workers = set()
+    for i in range(number_of_workers):
+        workers.add(fork_worker(app, host, port, listening_socket))
+    print("Serving on http://{0}:{1} with {2} workers".format(host, port, number_of_workers))
+
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while len(workers) > 0:
+        try:
+            pid, status = os.wait()
+        except InterruptedError:
+            continue
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if len(stopping) == 0:
+            print("Worker {} died, starting a new one".format(pid))
+            time.sleep(0.5)
+            workers.add(fork_worker(app, host, port, listening_socket))
+
+    listening_socket.close()
+    sys.exit(0)
@@ -7,14 +7,17 @@
 
 
 # Dependencies
+# TensorFlow and Keras are only imported when a trainable network is needed
+# (see create_trainable_model): rankings are computed with NumPy by default.
+import os
 import numpy as np                          # Installation: pip3 install numpy==1.14.3
-import tensorflow as tf                     # Installation: pip3 install tensorflow==1.8.0
-from keras.models import Sequential, Model  # Installation: pip3 install keras==2.1.6
-from keras.layers.normalization import BatchNormalization
-from keras.layers import Dense, Dropout
 from CRM import CRM
 from Agents import Agents
-from Geocoding import get_GPS_coordinates
+from FeatureStore import FeatureStore
+from FeatureEncoder import FeatureEncoder
+from MicroBatcher import MicroBatcher
+from ModelRegistry import ModelRegistry
+from InteractionHistory import read_history_chunks, count_history_rows
 
 
 class RankingNetwork(object):
@@ -23,23 +26,78 @@ class RankingNetwork(object):
         Used to rank agents.
     """
 
-    def __init__(self, crm, agents):
-        self.input_size = 11
+    def __init__(self, crm, agents, inference_only=True, weights_file="weights.h5",
+                 max_batch_size=256, max_batch_wait=0.002, features=None, reload_interval=30,
+                 encoder=None):
         self.crm = crm
         self.agents = agents
-        self.model = self.create_network()
+
+        # Language and category are encoded with lookup tables (see FeatureEncoder);
+        # the default configuration matches the bundled weights
+        if encoder is None:
+            encoder = FeatureEncoder()
+        self.encoder = encoder
+
+        # Contact and agent features are precomputed (see FeatureStore)
+        if features is None:
+            features = FeatureStore(crm, agents, sorted(self.encoder.languages.vocabulary))
+        self.features = features
+
+        # Contact features, interaction features, agent features
+        self.input_size = self.features.contact_feature_size + self.encoder.size + self.features.agent_feature_size
+        self.weights_file = weights_file
+        self.inference_only = inference_only
+
+        # The TensorFlow graph of the Keras model (None when using NumPy inference)
+        self.graph = None
+        self.model = None
+
+        # Versions of the weights: new versions saved while the bot runs
+        # (ex: by "-train") replace the model used for inference
+        self.registry = ModelRegistry(weights_file, self.input_size, self.set_model,
+                                      reload_interval if inference_only else None)
+
+        if inference_only:
+            try:
+                # Evaluates the trained network with NumPy, without TensorFlow
+                self.model = self.registry.load_latest()
+                print("Weights loaded from {} (NumPy inference)".format(self.registry.active_file))
+            except Exception as e:
+                print("NumPy inference not available ({}), using Keras".format(e))
+
+        if self.model is None:
+            self.model = self.create_trainable_model()
+
+        # Predictions requested by concurrent interactions are grouped
+        # and run in a single forward pass (see predict_batch)
+        self.batcher = MicroBatcher(self.predict_batch, max_batch_size, max_batch_wait)
+
+
+    def create_trainable_model(self):
+        """ Creates the Keras network and loads the trained weights, if available.
+        """
+        import tensorflow as tf                     # Installation: pip3 install tensorflow==1.8.0
+
+        model = self.create_network()
         try:
             # Loads weights from a trained network, if available
-            self.model.load_weights("weights.h5")
+            version, filename = self.registry.get_latest()
+            model.load_weights(filename)
             print("Weights loaded")
         except:
             pass
         self.graph = tf.get_default_graph()
 
+        return model
+
 
     def create_network(self):
         """ Creates the neural network. 
         """
+        from keras.models import Sequential         # Installation: pip3 install keras==2.1.6
+        from keras.layers.normalization import BatchNormalization
+        from keras.layers import Dense, Dropout
+
         model = Sequential()
 
         model.add(Dense(50, input_shape=(self.input_size,), activation="relu"))
@@ -54,132 +112,234 @@ class RankingNetwork(object):
         return model
 
 
-    def build_language_embedding(self, language):
-        """ Generates an embedding (vector) for the language.
-            Because this is an example and we have 2 languages only,
-            we'll keep things simple and hardcode small vectors.
-            With more languages, an alternative would be to use the 
-            HashingVectorizer from the scikit-learn package.
+    def build_input_matrix(self, contact_ids, languages, sentiments, categories, agent_ids):
+        """ Assembles the samples (one row per interaction) to feed the network,
+            from columns of contact ids, languages, sentiments, categories and agent ids.
+            Contact and agent features are gathered (joined by id) from the feature store.
         """
-        if language == "en":
-            return [0,1]
-        elif language == "es":
-            return [1,0]
-        else:
-            return [0,0]
+        n = len(agent_ids)
+        x = np.empty((n, self.input_size), dtype=np.float32)
+
+        # contact info: id, age, GPS coordinates (approximate latitude and longitude of the postal code)
+        contact_features = self.features.get_contact_features(contact_ids)
+        column = contact_features.shape[1]
+        x[:, :column] = contact_features
+
+        # interaction info: language, sentiment, category
+        # language and category are text fields and we must convert them to vectors
+        # (embeddings), written in place by the encoder
+        self.encoder.encode(languages, sentiments, categories, x[:, column:column + self.encoder.size])
+        column += self.encoder.size
+
+        # agent info: id, language skill (the one that matches the interaction language)
+        x[:, column:] = self.features.get_agent_features(agent_ids, languages)
 
+        return x
 
-    def build_category_embedding(self, category):
-        """ Generates an embedding (vector) for the category.
-            Because this is an example and we have 2 languages only,
-            we'll keep things simple and hardcode small vectors.
-            With more categories, an alternative would be to use the 
-            HashingVectorizer from the scikit-learn package.
+
+    def build_input_samples(self, contact_id, language, sentiment, category, agent_ids):
+        """ Assembles all the info of one interaction into samples
+            (one row per agent) to feed the network.
         """
-        if category == "sales":
-            return [0,1]
-        elif category == "support":
-            return [1,0]
-        else:
-            return [0,0]
+        n = len(agent_ids)
+        return self.build_input_matrix(
+            np.full(n, contact_id, dtype=np.int64),
+            [language] * n,
+            np.full(n, sentiment, dtype=np.float32),
+            [category] * n,
+            agent_ids)
 
 
     def build_input_sample(self, contact_id, language, sentiment, category, agent_id):
         """ Assembles all the info into a sample (vector) to feed the network.
         """
-        sample = []
+        return list(self.build_input_samples(contact_id, language, sentiment, category, [agent_id])[0])
 
-        # contact info: id, age, GPS coordinates (approximate latitude and longitude of the postal code)
 
-        contact = self.crm.get_contact_by_id(contact_id)
-        sample = [contact_id, contact["age"]]
-        if not "GPS" in contact:
-            # We get the GPS coordinates once per contact for performance reasons
-            contact["GPS"] = get_GPS_coordinates(contact["postal code"])
-        sample = sample + contact["GPS"]
-              
-        # interaction info: language, sentiment, category
-        # language and category are text fields and we must convert them to vectors
-        # (embeddings)
+    def set_model(self, model, filename=None):
+        """ Replaces the model used for inference. Predictions already running
+            finish with the previous model.
+        """
+        self.model = model
 
-        sample = sample + self.build_language_embedding(language)
-        sample.append(sentiment)
-        sample = sample + self.build_category_embedding(category)
 
-        # agent info: id, language skill (the one that matches the interaction language)
+    def predict_batch(self, x):
+        """ Runs one forward pass for a batch of input samples,
+            possibly coming from many interactions.
+        """
+        # New versions of the weights are watched for from the first prediction
+        # (whichever the path: predict or predict_matrix), in each process
+        watcher = self.registry.watcher
+        if watcher is None or not watcher.is_alive():
+            self.registry.start()
 
-        agent = self.agents.get_agent_by_id(agent_id)
-        if language=="en":
-            language_skill = agent["en"]
-        elif language=="es":
-            language_skill = agent["es"]
-        else:
-            language_skill = 0.0
-        sample += [agent_id, language_skill]
+        # The same model for the whole batch, even if it is replaced meanwhile
+        model = self.model
+        if self.graph is None:
+            return model.predict(np.array(x))
 
-        return sample        
+        with self.graph.as_default():
+            return model.predict(np.array(x), batch_size=max(1, len(x)))
 
 
     def predict(self, contact_id, language, sentiment, category, candidates):
         """ Makes a prediction of success for all the candidates.
+            Concurrent calls are batched together in a single forward pass.
         """
-        with self.graph.as_default():
-            # Let's first assemble the input data
-            x = []  # Input data
+        print("Creating the input vectors...")
 
-            print("Creating the input vectors...")
+        # Let's first assemble the input data (one row per candidate)
+        x = list(self.build_input_samples(contact_id, language, sentiment, category, candidates))
 
-            for candidate in candidates:
-                sample = self.build_input_sample(
-                    contact_id,
-                    language,
-                    sentiment,
-                    category,
-                    candidate)
-                x.append(sample)
+        print("Predicting...")
 
-            x = np.array(x)
+        results = self.batcher.submit(x)
 
-            print("Predicting...")
+        print("Done")
 
-            results = self.model.predict(x)
+        return results
 
-            print("Done")
 
-            return results
+    def predict_matrix(self, contact_ids, languages, sentiments, categories, agent_ids, max_rows=131072):
+        """ Predicts the success of every agent for every interaction (ex: all the waiting
+            interactions and all the available agents), without the micro-batcher.
+            Interactions are given as columns (contact ids, languages...).
+            Returns a matrix (interactions x agents). Samples are built and evaluated
+            in blocks of at most max_rows, to keep the memory bounded.
+        """
+        n = len(contact_ids)
+        m = len(agent_ids)
+        scores = np.zeros((n, m), dtype=np.float32)
+        if n == 0 or m == 0:
+            return scores
+
+        contact_ids = np.asarray(contact_ids)
+        languages = np.asarray(languages)
+        sentiments = np.asarray(sentiments, dtype=np.float32)
+        categories = np.asarray(categories)
+        agent_ids = np.asarray(agent_ids)
+
+        # Interactions per block
+        step = max(1, max_rows // m)
+        for start in range(0, n, step):
+            end = min(n, start + step)
+            x = self.build_input_matrix(
+                np.repeat(contact_ids[start:end], m),
+                np.repeat(languages[start:end], m),
+                np.repeat(sentiments[start:end], m),
+                np.repeat(categories[start:end], m),
+                np.tile(agent_ids, end - start))
+            scores[start:end] = np.asarray(self.predict_batch(x)).reshape(end - start, m)
+        return scores
+
+
+    def build_training_set(self, history):
+        """ Builds the training set from the history columns (see CRM.get_history_columns).
+            Returns the input data (one row per interaction) and the labels.
+        """
+        x = self.build_input_matrix(
+            history["contact id"],
+            history["language"],
+            history["sentiment"],
+            history["category"],
+            history["handled by"])
+        y = np.asarray(history["score"], dtype=np.float32)
+        return x, y
 
 
     def train(self, epochs):
         """ Trains the network with the crm data. 
         """
         # Let's first assemble the training set to feed the network
-        x = []  # Input data
-        y = []  # Labels
-
         print("Creating the training dataset...")
 
-        for interaction in self.crm.history:
-            sample = self.build_input_sample(
-                interaction["contact id"], 
-                interaction["language"], 
-                interaction["sentiment"], 
-                interaction["category"], 
-                interaction["handled by"])
-            x.append(sample)
-            y.append(interaction["score"])
-
-        x = np.array(x)
-        y = np.array(y) 
+        x, y = self.build_training_set(self.crm.get_history_columns())
 
         print("Training for {} epochs".format(epochs))
 
         # Train for n epochs
-        results = self.model.fit(x=x, y=y, epochs=epochs, batch_size=32)
+        model = self.get_trainable_model()
+        results = model.fit(x=x, y=y, epochs=epochs, batch_size=32)
         
         print("Model is trained")
 
-        # Saves weights (network state after training)
-        # to be loaded on future executions
-        self.model.save_weights("weights.h5")
+        self.save_trained_model(model)
+
+
+    def train_from_file(self, filename, epochs, batch_size=32, chunk_size=100000):
+        """ Trains the network with the history stored in a file (see InteractionHistory),
+            streaming it in chunks: memory usage depends on chunk_size,
+            not on the size of the history.
+        """
+        number_of_rows = count_history_rows(filename)
+        if number_of_rows == 0:
+            print("No interactions in {}".format(filename))
+            return
+        steps_per_epoch = (number_of_rows + batch_size - 1) // batch_size
+
+        print("Training for {0} epochs with {1} interactions from {2}".format(epochs, number_of_rows, filename))
 
+        model = self.get_trainable_model()
+        results = model.fit_generator(
+            self.generate_training_batches(filename, batch_size, chunk_size),
+            steps_per_epoch=steps_per_epoch,
+            epochs=epochs)
 
+        print("Model is trained")
+
+        self.save_trained_model(model)
+
+
+    def generate_training_batches(self, filename, batch_size, chunk_size):
+        """ Yields (x, y) batches read from a history file, forever (one pass per epoch).
+            Each chunk is shuffled; the rows left over at the end of a chunk
+            are carried over to the next one, so every batch but the last of
+            an epoch has exactly batch_size rows.
+        """
+        random = np.random.RandomState()
+        while True:
+            x_left = None
+            y_left = None
+            for chunk in read_history_chunks(filename, chunk_size):
+                x, y = self.build_training_set(chunk)
+                order = random.permutation(len(y))
+                x = x[order]
+                y = y[order]
+                if not x_left is None:
+                    x = np.concatenate([x_left, x])
+                    y = np.concatenate([y_left, y])
+
+                end = len(y) - len(y) % batch_size
+                for start in range(0, end, batch_size):
+                    yield x[start:start + batch_size], y[start:start + batch_size]
+                x_left = x[end:]
+                y_left = y[end:]
+
+            if not x_left is None and len(y_left) > 0:
+                yield x_left, y_left
+
+
+    def get_trainable_model(self):
+        """ Returns the Keras model (training needs it even when predicting with NumPy).
+        """
+        if self.graph is None:
+            return self.create_trainable_model()
+        return self.model
+
+
+    def save_trained_model(self, model):
+        """ Saves weights (network state after training) as a new version,
+            to be loaded on future executions and by running bots, and starts using them.
+        """
+        filename = self.registry.get_next_file()
+        # Written under another name first: a running bot never sees a half-written file
+        model.save_weights(filename + ".tmp")
+        os.replace(filename + ".tmp", filename)
+        print("Weights saved in {}".format(filename))
+
+        if self.inference_only:
+            self.graph = None
+            if not self.registry.check():
+                print("The new weights were not loaded, keeping the previous ones")
+        else:
+            self.model = model
@@ -0,0 +1,278 @@
+# -----------------------------------------------------
+# RoutingQueue module by Ricardo Santos.
+# Interactions that can't be routed right away (no
+# agent available) wait in a queue, and are assigned
+# as soon as a suitable agent is free again.
+# -----------------------------------------------------
+
+# Dependencies
+import heapq
+import itertools
+import threading
+import time
+
+
+class QueuedInteraction(object):
+    """ An interaction waiting for an agent.
+        'data' is anything the caller needs to finish the routing
+        (ex: the Messenger id of the customer).
+    """
+
+    __slots__ = ["interaction_id", "contact_id", "language", "sentiment", "intent",
+                 "arrival_time", "key", "data", "cancelled"]
+
+    def __init__(self, interaction_id, contact_id, language, sentiment, intent, arrival_time, key, data):
+        self.interaction_id = interaction_id
+        self.contact_id = contact_id
+        self.language = language
+        self.sentiment = sentiment
+        self.intent = intent
+        self.arrival_time = arrival_time
+        self.key = key
+        self.data = data
+        self.cancelled = False
+
+
+class RoutingQueue(object):
+    """ Waiting interactions, served by priority.
+        The priority of an interaction grows with its waiting time and with
+        the unhappiness of the customer: an interaction with sentiment s
+        is served as if it had arrived sentiment_weight * (1 - s) seconds
+        earlier (plus 'bonus' seconds given when it is queued, ex: a VIP
+        or a high predicted success). The priority is then a fixed key
+        (arrival time - advance), so waiting interactions never need to be
+        re-sorted as time passes.
+        There is a heap per (language, intent): when an agent is free, only
+        the heads of the heaps the agent has skills for are compared.
+        Cancelled interactions are left in the heaps and skipped when they
+        reach the head.
+        A contact waits at most once: an interaction queued for a contact that
+        is already waiting replaces the earlier one (and keeps its arrival
+        time, so asking again does not lose the place in the queue).
+        At most max_size interactions wait, and interactions waiting more than
+        max_wait seconds are dropped (None: no limit). Thread-safe.
+    """
+
+    def __init__(self, agents, sentiment_weight=120.0, max_size=10000, max_wait=3600.0, clock=time.time):
+        self.agents = agents
+        self.sentiment_weight = sentiment_weight
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.clock = clock
+
+        self.heaps = {}                 # (language, intent) -> heap of (key, interaction id, interaction)
+        self.interactions_by_id = {}    # Waiting interactions only
+        self.interaction_id_by_contact = {}
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self.interactions_by_id)
+
+
+    def enqueue(self, contact_id, language, sentiment, intent, data=None, bonus=0.0):
+        """ Parks an interaction until an agent can take it, replacing any interaction
+            of the same contact that is waiting. Returns its id, or None if the queue is full.
+        """
+        now = self.clock()
+        with self.lock:
+            arrival_time = now
+            earlier = self.interactions_by_id.get(self.interaction_id_by_contact.get(contact_id))
+            if not earlier is None:
+                arrival_time = earlier.arrival_time
+                earlier.cancelled = True
+                self.forget(earlier)
+            elif len(self.interactions_by_id) >= self.max_size:
+                self.remove_expired(now)
+                if len(self.interactions_by_id) >= self.max_size:
+                    return None
+
+            key = arrival_time - self.sentiment_weight * (1.0 - sentiment) - bonus
+            interaction_id = next(self.ids)
+            interaction = QueuedInteraction(interaction_id, contact_id, language, sentiment, intent,
+                                            arrival_time, key, data)
+            self.interactions_by_id[interaction_id] = interaction
+            self.interaction_id_by_contact[contact_id] = interaction_id
+            heap = self.heaps.get((language, intent))
+            if heap is None:
+                heap = []
+                self.heaps[(language, intent)] = heap
+            heapq.heappush(heap, (key, interaction_id, interaction))
+        return interaction_id
+
+
+    def cancel(self, interaction_id):
+        """ Removes a waiting interaction (ex: the customer left).
+            Returns False if it was not waiting.
+        """
+        with self.lock:
+            interaction = self.interactions_by_id.get(interaction_id)
+            if interaction is None:
+                return False
+            interaction.cancelled = True
+            self.forget(interaction)
+            return True
+
+
+    def forget(self, interaction):
+        """ Removes an interaction from the waiting ones (the lock must be held).
+        """
+        del self.interactions_by_id[interaction.interaction_id]
+        if self.interaction_id_by_contact.get(interaction.contact_id) == interaction.interaction_id:
+            del self.interaction_id_by_contact[interaction.contact_id]
+
+
+    def is_expired(self, interaction, now):
+        return not self.max_wait is None and now - interaction.arrival_time > self.max_wait
+
+
+    def remove_expired(self, now):
+        """ Drops the interactions waiting for more than max_wait seconds (the lock must be held).
+        """
+        for interaction in list(self.interactions_by_id.values()):
+            if self.is_expired(interaction, now):
+                self.expire(interaction)
+
+
+    def expire(self, interaction):
+        print("Interaction of contact {} dropped after waiting too long".format(interaction.contact_id))
+        interaction.cancelled = True
+        self.forget(interaction)
+
+
+    def get_position(self, interaction_id):
+        """ Returns the number of waiting interactions of the same kind served before this one,
+            or None if it is not waiting.
+        """
+        with self.lock:
+            interaction = self.interactions_by_id.get(interaction_id)
+            if interaction is None:
+                return None
+            heap = self.heaps[(interaction.language, interaction.intent)]
+            return sum(1 for entry in heap if not entry[2].cancelled and entry[0] < interaction.key)
+
+
+    def requeue(self, interaction):
+        """ Puts back an interaction taken from the queue, in the same place
+            (unless the contact has queued another one meanwhile).
+        """
+        with self.lock:
+            if interaction.contact_id in self.interaction_id_by_contact:
+                return
+            self.interactions_by_id[interaction.interaction_id] = interaction
+            self.interaction_id_by_contact[interaction.contact_id] = interaction.interaction_id
+            heap = self.heaps.get((interaction.language, interaction.intent))
+            if heap is None:
+                heap = []
+                self.heaps[(interaction.language, interaction.intent)] = heap
+            heapq.heappush(heap, (interaction.key, interaction.interaction_id, interaction))
+
+
+    def pop_all(self, max_interactions=None):
+        """ Removes and returns the waiting interactions (at most max_interactions),
+            highest priority first.
+        """
+        with self.lock:
+            self.remove_expired(self.clock())
+            interactions = sorted(self.interactions_by_id.values(), key=lambda interaction: interaction.key)
+            if not max_interactions is None:
+                interactions = interactions[:max_interactions]
+            for interaction in interactions:
+                self.forget(interaction)
+
+            # Rebuild the heaps with the interactions still waiting
+            heaps = {}
+            for key, heap in self.heaps.items():
+                heap = [entry for entry in heap if entry[1] in self.interactions_by_id]
+                if len(heap) > 0:
+                    heapq.heapify(heap)
+                    heaps[key] = heap
+            self.heaps = heaps
+        return interactions
+
+
+    def peek_head(self, heap, now):
+        """ Returns the first interaction of a heap that was not cancelled (or None).
+            Expired interactions found on the way are dropped.
+        """
+        while len(heap) > 0 and (heap[0][2].cancelled or self.is_expired(heap[0][2], now)):
+            interaction = heapq.heappop(heap)[2]
+            if not interaction.cancelled:
+                self.expire(interaction)
+        if len(heap) == 0:
+            return None
+        return heap[0][2]
+
+
+    def pop_for_agent(self, agent_id):
+        """ Removes and returns the waiting interaction with the highest priority
+            that the agent has some skill for (same rule as the candidate
+            generation: some skill in the language or in the intent), or None.
+        """
+        skill_index = self.agents.skill_index
+        row = skill_index.row_by_agent_id.get(agent_id)
+        if row is None:
+            return None
+        skills = skill_index.skills[row]
+
+        now = self.clock()
+        with self.lock:
+            best = None
+            for (language, intent), heap in self.heaps.items():
+                score = 0.0
+                if language in skill_index.column_map:
+                    score += skills[skill_index.column_map[language]]
+                if intent in skill_index.column_map:
+                    score += skills[skill_index.column_map[intent]]
+                if score <= 0.:
+                    continue
+                head = self.peek_head(heap, now)
+                if not head is None and (best is None or head.key < best.key):
+                    best = head
+
+            if best is None:
+                return None
+            heap = self.heaps[(best.language, best.intent)]
+            heapq.heappop(heap)
+            self.forget(best)
+            return best
+
+
+    def assign(self, agent_id, on_assigned, reserve=True):
+        """ Gives waiting interactions to an agent, up to its free chats (an agent may
+            handle several chats). If 'reserve' is set, every interaction takes one of
+            them (see AgentStates.start_chat). on_assigned(interaction, agent_id)
+            is called for every interaction assigned. Returns the number assigned.
+        """
+        free_chats = self.agents.states.get_free_chats([agent_id])[0]
+        assigned = 0
+        while assigned < free_chats:
+            interaction = self.pop_for_agent(agent_id)
+            if interaction is None:
+                break
+            if reserve and not self.agents.states.start_chat(agent_id):
+                # The agent was taken meanwhile: the interaction keeps its place
+                self.requeue(interaction)
+                break
+            try:
+                on_assigned(interaction, agent_id)
+            except Exception as e:
+                # Ex: the customer could not be told (see unassign)
+                print("Error assigning the interaction of contact {0}: {1}".format(interaction.contact_id, e))
+                self.unassign(interaction, agent_id, reserve)
+                break
+            assigned += 1
+        return assigned
+
+
+    def unassign(self, interaction, agent_id, reserved):
+        """ Puts back an interaction whose assignment failed, in the same place, and
+            frees the chat it took if 'reserved'. The listeners of the agent states are
+            not told that the agent is free again: they would retry it at once
+            (ex: while Facebook is down); the interaction is tried again on the next
+            agent event or batch routing tick.
+        """
+        self.requeue(interaction)
+        if reserved:
+            self.agents.states.end_chat(agent_id, notify=False)
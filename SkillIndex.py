@@ -0,0 +1,200 @@
+# -----------------------------------------------------
+# SkillIndex module by Ricardo Santos.
+# Keeps the agent skills in an array so the best
+# candidates for an interaction can be selected
+# without walking every agent profile.
+# -----------------------------------------------------
+
+# Dependencies
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+
+
+class SkillIndex(object):
+    """ Array-backed index of agent skills.
+        Each row holds the skills of one agent and each column one skill
+        (a language or an intent). Rows are updated incrementally when
+        an agent is added, removed or has its skills changed.
+    """
+
+    def __init__(self, skill_columns, initial_capacity=64):
+        self.skill_columns = list(skill_columns)
+        self.column_map = {}
+        for i in range(len(self.skill_columns)):
+            self.column_map[self.skill_columns[i]] = i
+
+        # Agent skills (one row per agent) and the agent id of each row.
+        # Skills are a contiguous float32 matrix (agents x skill columns), so
+        # scoring all the agents is a single matrix-vector product.
+        # Arrays grow by doubling, so only the first 'size' rows are in use.
+        self.skills = np.zeros((initial_capacity, len(self.skill_columns)), dtype=np.float32)
+        self.agent_ids = np.zeros(initial_capacity, dtype=np.int64)
+        self.row_by_agent_id = {}
+        self.size = 0
+
+
+    def __len__(self):
+        return self.size
+
+
+    def grow(self):
+        """ Doubles the capacity of the index.
+        """
+        capacity = max(1, 2 * len(self.agent_ids))
+
+        skills = np.zeros((capacity, len(self.skill_columns)), dtype=np.float32)
+        skills[:self.size] = self.skills[:self.size]
+        self.skills = skills
+
+        agent_ids = np.zeros(capacity, dtype=np.int64)
+        agent_ids[:self.size] = self.agent_ids[:self.size]
+        self.agent_ids = agent_ids
+
+
+    def set_agent(self, agent_id, skills):
+        """ Inserts or updates the skills of an agent.
+            'skills' maps skill names to levels; skills not
+            in the index are ignored and missing ones count as 0.
+        """
+        row = self.row_by_agent_id.get(agent_id)
+        if row is None:
+            if self.size == len(self.agent_ids):
+                self.grow()
+            row = self.size
+            self.size += 1
+            self.row_by_agent_id[agent_id] = row
+            self.agent_ids[row] = agent_id
+
+        for name in self.skill_columns:
+            self.skills[row, self.column_map[name]] = skills.get(name, 0.0)
+
+
+    def load_agents(self, agents):
+        """ Bulk load of agent profiles (dicts with an "agent id" and the skills).
+            Replaces the whole index.
+        """
+        agents = list(agents)
+        capacity = max(1, len(agents))
+
+        self.skills = np.zeros((capacity, len(self.skill_columns)), dtype=np.float32)
+        self.agent_ids = np.zeros(capacity, dtype=np.int64)
+        self.row_by_agent_id = {}
+        self.size = len(agents)
+
+        for row in range(len(agents)):
+            agent = agents[row]
+            self.agent_ids[row] = agent["agent id"]
+            self.row_by_agent_id[agent["agent id"]] = row
+            self.skills[row] = [agent.get(name, 0.0) for name in self.skill_columns]
+
+
+    def remove_agent(self, agent_id):
+        """ Removes an agent from the index.
+            The last row is moved into the freed slot to keep rows contiguous;
+            agent_ids[size] keeps the id of the agent that was in the last row.
+        """
+        row = self.row_by_agent_id.pop(agent_id, None)
+        if row is None:
+            return
+
+        last = self.size - 1
+        if row != last:
+            self.skills[row] = self.skills[last]
+            self.agent_ids[row] = self.agent_ids[last]
+            self.row_by_agent_id[int(self.agent_ids[row])] = row
+        self.skills[last] = 0.0
+        self.size = last
+
+
+    def query_vector(self, language, intent):
+        """ Builds the weight vector of an interaction:
+            weight 1 for the language and intent skills needed, 0 for the others.
+        """
+        weights = np.zeros(len(self.skill_columns), dtype=np.float32)
+        if language in self.column_map:
+            weights[self.column_map[language]] = 1.0
+        if intent in self.column_map:
+            weights[self.column_map[intent]] = 1.0
+        return weights
+
+
+    def query_matrix(self, interactions):
+        """ Builds the weight vectors of many interactions at once.
+            'interactions' is a list of (language, intent) pairs.
+            Returns a matrix with one row per interaction.
+        """
+        weights = np.zeros((len(interactions), len(self.skill_columns)), dtype=np.float32)
+        for i in range(len(interactions)):
+            language, intent = interactions[i]
+            if language in self.column_map:
+                weights[i, self.column_map[language]] = 1.0
+            if intent in self.column_map:
+                weights[i, self.column_map[intent]] = 1.0
+        return weights
+
+
+    def score_batch(self, weights):
+        """ Scores all the agents for many interactions in one matrix product.
+            'weights' has one row per interaction (see query_matrix).
+            Returns a matrix (interactions x agents) of skill for the job;
+            column j belongs to the agent in self.agent_ids[j].
+        """
+        return np.dot(weights, self.skills[:self.size].T)
+
+
+    def select_top_k(self, scores, k, rows=None):
+        """ Returns up to k tuples (agent id, score) from a row of scores, best first.
+            Agents with absolutely no skills for the job are left out.
+            Uses a partial selection, so only the k best rows get sorted.
+            If 'rows' (sorted) is given, scores[i] is the score of the agent in rows[i].
+        """
+        positions = np.flatnonzero(scores > 0.)
+        if len(positions) > k:
+            # Keep the rows scoring at least the k-th best score
+            # (ties with the k-th row included, so the cut below is stable)
+            kth_score = -np.partition(-scores[positions], k - 1)[k - 1]
+            positions = positions[scores[positions] >= kth_score]
+
+        # Best score first, ties in row order
+        positions = positions[np.lexsort((positions, -scores[positions]))][:k]
+
+        agent_ids = self.agent_ids if rows is None else self.agent_ids[rows]
+        return [(int(agent_ids[i]), float(scores[i])) for i in positions]
+
+
+    def top_k(self, weights, k, mask=None):
+        """ Returns up to k tuples (agent id, skill for the job), best first.
+            If 'mask' is given, only the rows where it is True are candidates.
+        """
+        if self.size == 0 or k <= 0:
+            return []
+
+        scores = np.dot(self.skills[:self.size], weights)
+        if not mask is None:
+            # Rows added after the mask was taken are left out
+            scores[:len(mask)][~mask[:len(scores)]] = 0.
+            scores[len(mask):] = 0.
+        return self.select_top_k(scores, k)
+
+
+    def top_k_rows(self, weights, rows, k):
+        """ Same as top_k, scoring only some rows of the index (sorted, ex: the available agents).
+        """
+        if len(rows) == 0 or k <= 0:
+            return []
+
+        return self.select_top_k(np.dot(self.skills[rows], weights), k, rows)
+
+
+    def top_k_batch(self, weights, k, rows=None):
+        """ Same as top_k for many interactions, scored in a single call.
+            If 'rows' (sorted) is given, only those rows of the index are scored.
+            Returns one list of (agent id, skill for the job) per row of 'weights'.
+        """
+        if self.size == 0 or k <= 0 or (not rows is None and len(rows) == 0):
+            return [[] for _ in range(len(weights))]
+
+        if rows is None:
+            scores = self.score_batch(weights)
+        else:
+            scores = np.dot(weights, self.skills[rows].T)
+        return [self.select_top_k(row, k, rows) for row in scores]
@@ -6,8 +6,19 @@
 # -----------------------------------------------------
 
 # Dependencies
-import requests             # Installation: pip3 install requests==2.18.4
+import HttpClient           # Shared HTTP client (connection pooling, timeouts and retries)
 from pprint import pprint
+from MicroBatcher import MicroBatcher
+from Cache import LRUCache, SQLiteCache
+from LanguageDetector import LanguageDetector
+from IntentClassifier import IntentClassifier, intent_samples
+
+
+def normalize_text(text):
+    """ Normalizes a text to be used as a cache key:
+        lower case, without surrounding punctuation and with single spaces.
+    """
+    return " ".join(text.lower().strip(" \t\n.,;:!?¡¿'\"").split())
 
 
 
@@ -16,7 +27,8 @@ class TextAnalytics(object):
         to extract relevant content from the user input.
     """
 
-    def __init__(self):
+    def __init__(self, coalesce_window=0.02, cache_size=10000, cache_ttl=24*3600, shared_cache_file=None,
+                 local_language_confidence=0.85, local_intent_confidence=0.7):
         # Needed for Microsoft Text Analytics services
         self.text_analytics_subscription_key = "Replace by your Text Analytics subscription key"
         self.text_analytics_base_url = "https://westeurope.api.cognitive.microsoft.com/text/analytics/v2.0/"
@@ -26,42 +38,155 @@ class TextAnalytics(object):
         self.LUIS_en_base_url = "Replace by your LUIS endpoint for English text" # ex: https://westeurope.api.cognitive.microsoft.com/luis/v2.0/apps/xxxxx
         self.LUIS_es_base_url = "Replace by your LUIS endpoint for Spanish text" # ex: https://westeurope.api.cognitive.microsoft.com/luis/v2.0/apps/yyyyy
 
+        # The Text Analytics API accepts up to 1000 documents per request
+        self.max_documents_per_request = 1000
+
+        # Extra arguments of the API calls (see HttpClient.request), ex: a
+        # shorter timeout and no retries when the caller has a deadline
+        self.http_options = {}
+
+        # Languages are first guessed locally; the Language API is only called
+        # when the local confidence is below local_language_confidence (None: always call it)
+        self.language_detector = None
+        self.local_language_confidence = local_language_confidence
+        if not local_language_confidence is None:
+            self.language_detector = LanguageDetector()
+
+        # Intents are also guessed locally first (one classifier per language, trained
+        # with the bundled samples); LUIS is only called when the confidence is
+        # below local_intent_confidence (None: always call it)
+        self.intent_classifiers = {}
+        self.local_intent_confidence = local_intent_confidence
+        if not local_intent_confidence is None:
+            for language in intent_samples:
+                self.intent_classifiers[language] = IntentClassifier(intent_samples[language])
+
+        # Results are cached by normalized text (and language), so repeated messages
+        # ("hi", "hola", ...) don't call the APIs again. If shared_cache_file is given,
+        # the cache is shared through that SQLite file by all the worker processes.
+        self.cache = None
+        if cache_size > 0:
+            shared_cache = None
+            if not shared_cache_file is None:
+                shared_cache = SQLiteCache(shared_cache_file, "text_analytics", cache_ttl)
+            self.cache = LRUCache(cache_size, cache_ttl, shared_cache)
+
+        # Language and sentiment requests for texts arriving within 'coalesce_window'
+        # seconds are grouped and sent as a single request (no grouping if None)
+        self.language_batcher = None
+        self.sentiment_batcher = None
+        if not coalesce_window is None:
+            self.language_batcher = MicroBatcher(
+                self.request_languages, self.max_documents_per_request, coalesce_window)
+            self.sentiment_batcher = MicroBatcher(
+                lambda items: self.request_sentiments([item[0] for item in items], [item[1] for item in items]),
+                self.max_documents_per_request, coalesce_window)
+
+
+    def get_cached(self, key):
+        if self.cache is None:
+            return False, None
+        return self.cache.get(key)
+
+
+    def set_cached(self, key, value):
+        if not self.cache is None:
+            self.cache.set(key, value)
+
+
+    def get_cache_stats(self):
+        """ Returns the cache hits and misses (None if there is no cache).
+        """
+        if self.cache is None:
+            return None
+        return self.cache.get_stats()
+
+
+    def supported_language(self, language):
+        """ We'll only support 2 languages: "en" and "es".
+        """
+        # Catalan will default to "es"
+        if language=="ca":
+            return "es"
+        # Any other language will default to "en"
+        if not language=="es" and not language=="en":
+            return "en"
+        return language
+
 
     def guess_language(self, text, verbose=False):
         """ Guesses the language of a given text.
             Returns the ISO-6391 identifier of the language ("en" or "es"). 
+            Texts detected confidently by the local detector don't call the API; other results
+            are cached, and texts arriving at the same time are sent in a single request.
         """
+        if not self.language_detector is None:
+            language, confidence = self.language_detector.detect(text)
+            if confidence >= self.local_language_confidence:
+                if verbose:
+                    print("guess_language returning '{0}' (local, confidence {1:.2f})".format(language, confidence))
+                return language
+
+        key = "language|" + normalize_text(text)
+        found, ret = self.get_cached(key)
+
+        if not found:
+            if self.language_batcher is None:
+                ret = self.request_languages([text], verbose)[0]
+            else:
+                ret = self.language_batcher.submit([text])[0]
+            if ret is None:
+                # Not cached, so it's asked again next time
+                ret = ""
+            else:
+                self.set_cached(key, ret)
 
-        language_api_url = self.text_analytics_base_url + "languages"
+        ret = self.supported_language(ret)
+
+        if verbose:
+            print("guess_language returning '{}'".format(ret))
+
+        return ret
+
+
+    def guess_languages(self, texts, verbose=False):
+        """ Guesses the language of many texts, with one request per
+            max_documents_per_request texts.
+            Returns a list with the ISO-6391 identifier of the language of each text ("en" or "es").
+        """
+        return [self.supported_language(language or "") for language in self.request_languages(texts, verbose)]
 
-        documents = { 'documents': [
-            { 'id': '1', 'text': text },    
-        ]}
 
+    def request_languages(self, texts, verbose=False):
+        """ Calls the Language API for many texts.
+            Returns the ISO-6391 identifier of the language detected for each text
+            (any language) or None if it could not be detected.
+        """
+
+        language_api_url = self.text_analytics_base_url + "languages"
         headers   = {"Ocp-Apim-Subscription-Key": self.text_analytics_subscription_key}
-        response  = requests.post(language_api_url, headers=headers, json=documents)
-        languages = response.json()
-    
-        try:         
-            ret = languages["documents"][0]["detectedLanguages"][0]["iso6391Name"]
-        except Exception as e:
-            print("Error in guess_language: {}".format(e))
-            ret = ""
 
-        if verbose:
-            print("Language API return for input '{}':".format(text))
-            pprint(languages)        
+        ret = [None] * len(texts)
 
-        # We'll only support 2 languages: "en" and "es"
-        # Catalan will default to "es"
-        if ret=="ca":
-            ret = "es"
-        # Any other language will default to "en"
-        if not ret=="es" and not ret=="en":
-            ret = "en"
+        for start in range(0, len(texts), self.max_documents_per_request):
+            # The document id is the position of the text in the list
+            documents = { 'documents': [
+                { 'id': str(i), 'text': texts[i] }
+                for i in range(start, min(len(texts), start + self.max_documents_per_request))
+            ]}
 
-        if verbose:
-            print("guess_language returning '{}'".format(ret))
+            response  = HttpClient.post(language_api_url, headers=headers, json=documents, **self.http_options)
+            languages = response.json()
+
+            try:
+                for document in languages["documents"]:
+                    ret[int(document["id"])] = document["detectedLanguages"][0]["iso6391Name"]
+            except Exception as e:
+                print("Error in guess_languages: {}".format(e))
+
+            if verbose:
+                print("Language API return for {} inputs:".format(len(documents['documents'])))
+                pprint(languages)        
 
         return ret
 
@@ -69,40 +194,93 @@ class TextAnalytics(object):
     def guess_sentiment(self, text, language, verbose=False):
         """ Guesses the sentiment of a given text.
             Returns a number from 0 (negative sentiment) to 1 (positive sentiment). 
+            Results are cached; texts arriving at the same time are sent in a single request.
         """
+        key = "sentiment|" + language + "|" + normalize_text(text)
+        found, ret = self.get_cached(key)
+
+        if not found:
+            if self.sentiment_batcher is None:
+                ret = self.request_sentiments([text], [language], verbose)[0]
+            else:
+                ret = self.sentiment_batcher.submit([(text, language)])[0]
+            if ret is None:
+                # Not cached, so it's asked again next time
+                ret = 0.5
+            else:
+                self.set_cached(key, ret)
+
+        if verbose:
+            print("guess_sentiment returning '{}'".format(ret))
+
+        return ret
+
+
+    def guess_sentiments(self, texts, languages, verbose=False):
+        """ Guesses the sentiment of many texts (languages has the language of each text),
+            with one request per max_documents_per_request texts.
+            Returns a list of numbers from 0 (negative sentiment) to 1 (positive sentiment). 
+        """
+        return [0.5 if sentiment is None else sentiment for sentiment in self.request_sentiments(texts, languages, verbose)]
 
-        sentiment_api_url = self.text_analytics_base_url + "sentiment"
 
-        documents = { 'documents': [
-            { 'id': '1', 'language': language, 'text': text }
-        ]}
+    def request_sentiments(self, texts, languages, verbose=False):
+        """ Calls the Sentiment API for many texts.
+            Returns the sentiment of each text, or None if it could not be found.
+        """
 
+        sentiment_api_url = self.text_analytics_base_url + "sentiment"
         headers   = {"Ocp-Apim-Subscription-Key": self.text_analytics_subscription_key}
-        response  = requests.post(sentiment_api_url, headers=headers, json=documents)
-        sentiments = response.json()
-    
-        try:         
-            ret = sentiments["documents"][0]["score"]
-        except Exception as e:
-            print("Error in guess_sentiment: {}".format(e))
-            ret = 0.5
 
-        if verbose:
-            print("Sentiment API return for input '{0}' in language '{1}':".format(text, language))
-            pprint(sentiments)        
-            print("guess_sentiment returning '{}'".format(ret))
+        ret = [None] * len(texts)
+
+        for start in range(0, len(texts), self.max_documents_per_request):
+            # The document id is the position of the text in the list
+            documents = { 'documents': [
+                { 'id': str(i), 'language': languages[i], 'text': texts[i] }
+                for i in range(start, min(len(texts), start + self.max_documents_per_request))
+            ]}
+
+            response  = HttpClient.post(sentiment_api_url, headers=headers, json=documents, **self.http_options)
+            sentiments = response.json()
+
+            try:
+                for document in sentiments["documents"]:
+                    ret[int(document["id"])] = document["score"]
+            except Exception as e:
+                print("Error in guess_sentiments: {}".format(e))
+
+            if verbose:
+                print("Sentiment API return for {} inputs:".format(len(documents['documents'])))
+                pprint(sentiments)        
 
         return ret
 
 
     def guess_intent(self, text, language, verbose=False):
         """ Guesses the intent of a given text.
-            Returns the intent: "sales", "support" or "other". 
+            Returns the intent: "sales", "support" or "other" (not understood),
+            or None if LUIS could not be reached.
             Note: this method uses Microsoft LUIS to extract the intent,
             which in turn must be configured and trained manually in the LUIS website
             (the european version https://eu.luis.ai/home was used in this sample).
+            A local classifier answers first; LUIS is only called when it is not confident.
         """
 
+        if language in self.intent_classifiers:
+            intent, confidence = self.intent_classifiers[language].predict(text)
+            if confidence >= self.local_intent_confidence:
+                if verbose:
+                    print("guess_intent returning '{0}' (local, confidence {1:.2f})".format(intent, confidence))
+                return intent
+
+        key = "intent|" + language + "|" + normalize_text(text)
+        found, ret = self.get_cached(key)
+        if found:
+            if verbose:
+                print("guess_intent returning cached '{}'".format(ret))
+            return ret
+
         headers = {
             # Request headers
             'Ocp-Apim-Subscription-Key': self.LUIS_subscription_key,
@@ -119,11 +297,13 @@ class TextAnalytics(object):
         }
 
         ret = "other"
+        intents = None
+        failed = False
 
         try:
             if language=="es":
                 # Spanish culture
-                response = requests.get(self.LUIS_es_base_url, headers=headers, params=params)
+                response = HttpClient.get(self.LUIS_es_base_url, headers=headers, params=params, **self.http_options)
                 intents = response.json()                       
                 top_scoring_intent = intents["topScoringIntent"]
                 if top_scoring_intent["intent"] == "Ventas":
@@ -136,7 +316,7 @@ class TextAnalytics(object):
                     ret = "other"
             else:
                 # English culture
-                response = requests.get(self.LUIS_en_base_url, headers=headers, params=params)
+                response = HttpClient.get(self.LUIS_en_base_url, headers=headers, params=params, **self.http_options)
                 intents = response.json()                       
                 top_scoring_intent = intents["topScoringIntent"]
                 if top_scoring_intent["intent"] == "Sales":
@@ -149,7 +329,11 @@ class TextAnalytics(object):
                     ret = "other"
         except Exception as e:
             print("Error in guess_intent: {}".format(e))
-            ret = "other"
+            ret = None
+            failed = True
+
+        if not failed:
+            self.set_cached(key, ret)
 
         if verbose:
             print("LUIS return for input '{}':".format(text))
@@ -0,0 +1,68 @@
+# -----------------------------------------------------
+# Benchmarks the batch assignment of waiting interactions
+# (see Assignment.assign) against the greedy routing
+# (each interaction, in order, takes its best agent that
+# still has a free chat), on synthetic predicted scores.
+# Scores share an agent component (some agents are
+# better for everybody), so the greedy routing piles
+# the interactions on the strongest agents.
+#
+# Usage: python3 benchmark_assignment.py [interactions] [agents]
+# -----------------------------------------------------
+
+# Dependencies
+import sys
+import time
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+import Assignment
+
+
+def create_scores(number_of_interactions, number_of_agents, random):
+    agent_strength = random.uniform(0.0, 1.0, number_of_agents)
+    affinity = random.uniform(0.0, 0.5, (number_of_interactions, number_of_agents))
+    scores = (agent_strength + affinity).astype(np.float32)
+    # Agents with no skill for the interaction (language or intent)
+    allowed = random.rand(number_of_interactions, number_of_agents) < 0.5
+    capacities = random.randint(1, 3, number_of_agents)
+    return scores, allowed, capacities
+
+
+def assign_greedy(scores, capacities, allowed):
+    free_chats = capacities.copy()
+    result = np.full(len(scores), -1, dtype=np.int64)
+    for i in range(len(scores)):
+        candidates = np.flatnonzero(allowed[i] & (free_chats > 0))
+        if len(candidates) > 0:
+            best = candidates[np.argmax(scores[i, candidates])]
+            result[i] = best
+            free_chats[best] -= 1
+    return result
+
+
+def describe(name, scores, result, seconds):
+    assigned = np.flatnonzero(result >= 0)
+    print("{0:<20} {1:5d} assigned, total predicted success {2:9.1f}, {3:.3f}s".format(
+        name, len(assigned), np.sum(scores[assigned, result[assigned]]), seconds))
+
+
+if __name__ == '__main__':
+    number_of_interactions = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    number_of_agents = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    scores, allowed, capacities = create_scores(number_of_interactions, number_of_agents, np.random.RandomState(0))
+    print("{0} interactions, {1} agents ({2} chats)".format(number_of_interactions, number_of_agents, np.sum(capacities)))
+
+    start = time.perf_counter()
+    result = assign_greedy(scores, capacities, allowed)
+    describe("Greedy", scores, result, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    result = Assignment.assign(scores, capacities, allowed, use_scipy=False)
+    describe("Auction", scores, result, time.perf_counter() - start)
+
+    if not Assignment.linear_sum_assignment is None:
+        start = time.perf_counter()
+        result = Assignment.assign(scores, capacities, allowed, use_scipy=True)
+        describe("scipy", scores, result, time.perf_counter() - start)
+    else:
+        print("scipy is not installed")
@@ -0,0 +1,74 @@
+# -----------------------------------------------------
+# Benchmarks the batch routing end to end (see
+# AIRouter.assign_batch): scoring every waiting
+# interaction against every available agent with the
+# ranking network, then solving the assignment with
+# scipy and with the auction fallback, for several
+# numbers of waiting interactions. The batch routing
+# of a tick must fit in the interval between ticks
+# (see AIRouter.batch_routing_max_pairs): 1000
+# interactions x 1000 agents do not fit in a tick of
+# 1s (see the comment there for why).
+#
+# Usage: python3 benchmark_batch_routing.py [agents]
+# -----------------------------------------------------
+
+# Dependencies
+import sys
+import time
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+from CRM import CRM
+from Agents import Agents
+from AIRouter import AIRouter
+import Assignment
+
+
+languages = ["en", "es"]
+intents = ["sales", "support"]
+
+
+def create_agents(number_of_agents, random):
+    agents = Agents()
+    agents.load_agents([
+        dict([("agent id", i), ("name", "Agent {}".format(i)), ("capacity", int(random.randint(1, 3)))] +
+             [(skill, float(random.choice([0.0, 0.5, 1.0]))) for skill in agents.skill_columns])
+        for i in range(number_of_agents)])
+    return agents
+
+
+def create_interactions(number_of_interactions, crm, random):
+    contact_ids = [contact["contact id"] for contact in crm.contacts]
+    return [(contact_ids[random.randint(len(contact_ids))], languages[random.randint(len(languages))],
+             float(random.rand()), intents[random.randint(len(intents))])
+            for i in range(number_of_interactions)]
+
+
+if __name__ == '__main__':
+    number_of_agents = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    random = np.random.RandomState(0)
+    crm = CRM()
+    router = AIRouter(crm, create_agents(number_of_agents, random))
+    print("{0} agents: at most {1} interactions per tick (batch_routing_max_pairs = {2})".format(
+        number_of_agents, router.batch_routing_max_pairs // number_of_agents, router.batch_routing_max_pairs))
+
+    for number_of_interactions in [100, 250, 500, 1000]:
+        interactions = create_interactions(number_of_interactions, crm, random)
+        contact_ids, interaction_languages, sentiments, interaction_intents = [list(column) for column in zip(*interactions)]
+        rows = router.agents.states.get_available_rows(set(interaction_languages) | set(interaction_intents))
+        agent_ids = router.agents.skill_index.agent_ids[rows]
+
+        start = time.perf_counter()
+        router.ranking_network.predict_matrix(contact_ids, interaction_languages, sentiments, interaction_intents, agent_ids)
+        scoring_seconds = time.perf_counter() - start
+
+        solvers = [("auction", False)]
+        if not Assignment.linear_sum_assignment is None:
+            solvers.insert(0, ("scipy", True))
+        for name, use_scipy in solvers:
+            start = time.perf_counter()
+            result = router.assign_batch(interactions, use_scipy=use_scipy)
+            seconds = time.perf_counter() - start
+            print("{0:5d} interactions, {1:<8} {2:6.3f}s ({3:.3f}s scoring), {4} assigned".format(
+                number_of_interactions, name, seconds, scoring_seconds,
+                sum(1 for agent_id in result if not agent_id is None)))
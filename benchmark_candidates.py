@@ -0,0 +1,82 @@
+# -----------------------------------------------------
+# Benchmarks the candidate generation on a large,
+# synthetic contact center: the exact generator (every
+# available agent is scored) against the IVF generator
+# for several max_number_of_candidates (k) and nprobe.
+# Recall: share of the exact top k that the IVF finds
+# (an agent as good as the exact k-th one also counts,
+# since ties may be broken differently).
+#
+# Usage: python3 benchmark_candidates.py [agents] [queries]
+# -----------------------------------------------------
+
+# Dependencies
+import sys
+import time
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+from Agents import Agents
+from AgentStates import busy
+from CandidateGenerators import ExactCandidateGenerator, IVFCandidateGenerator
+
+
+languages = ["en", "es"]
+intents = ["sales", "support"]
+
+
+def create_agents(number_of_agents, random):
+    agents = Agents()
+    agents.load_agents([
+        dict([("agent id", i), ("name", "Agent {}".format(i))] +
+             # Half of the agents have each skill, at some level
+             [(skill, float(random.rand() < 0.5) * float(random.rand())) for skill in agents.skill_columns])
+        for i in range(number_of_agents)])
+    # Some agents are on a break
+    for agent_id in random.choice(number_of_agents, number_of_agents // 3, replace=False):
+        agents.states.set_state(int(agent_id), busy)
+    return agents
+
+
+def measure(generator, queries, k):
+    """ Returns (average seconds per query, results).
+    """
+    start = time.perf_counter()
+    results = [generator.generate(language, intent, k) for language, intent in queries]
+    return (time.perf_counter() - start) / len(queries), results
+
+
+def get_recall(exact_results, results):
+    found = 0
+    total = 0
+    for exact, approximate in zip(exact_results, results):
+        if len(exact) == 0:
+            continue
+        kth_score = exact[-1][1]
+        found += min(len(exact), sum(1 for agent_id, score in approximate if score >= kth_score))
+        total += len(exact)
+    return found / max(1, total)
+
+
+if __name__ == '__main__':
+    number_of_agents = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    number_of_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    random = np.random.RandomState(0)
+    agents = create_agents(number_of_agents, random)
+    queries = [(languages[random.randint(len(languages))], intents[random.randint(len(intents))])
+               for i in range(number_of_queries)]
+
+    exact = ExactCandidateGenerator(agents)
+    ivf = IVFCandidateGenerator(agents)
+    start = time.perf_counter()
+    ivf.build()
+    print("{0} agents, IVF with {1} lists built in {2:.3f}s".format(
+        number_of_agents, len(ivf.centroids), time.perf_counter() - start))
+
+    for k in [3, 10, 50]:
+        exact_seconds, exact_results = measure(exact, queries, k)
+        print("k={0:<3} exact            {1:8.3f}ms per query".format(k, exact_seconds * 1000))
+        for nprobe in [1, 2, 4, 8, 16]:
+            ivf.nprobe = nprobe
+            seconds, results = measure(ivf, queries, k)
+            print("      IVF nprobe={0:<3}  {1:8.3f}ms per query, recall {2:.3f}".format(
+                nprobe, seconds * 1000, get_recall(exact_results, results)))
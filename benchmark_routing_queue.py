@@ -0,0 +1,121 @@
+# -----------------------------------------------------
+# Simulates a contact center to benchmark the routing
+# queue: interactions arrive at random (Poisson), are
+# routed at once if an agent is available or wait in
+# the RoutingQueue otherwise, and chats end after a
+# random duration, freeing the agent for the next one.
+# Time is simulated, so the benchmark runs in seconds.
+# Reports the routing throughput (wall clock) and the
+# average wait (simulated), first in order of arrival
+# and then with priority to unhappy customers.
+#
+# Usage: python3 benchmark_routing_queue.py [interactions]
+# -----------------------------------------------------
+
+# Dependencies
+import sys
+import time
+import heapq
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+from Agents import Agents
+from RoutingQueue import RoutingQueue
+
+
+number_of_agents = 500
+chats_per_agent = 2
+mean_chat_duration = 300.0      # seconds
+load = 0.98                     # arrivals / capacity of the contact center (below 1, so the queue
+                                # is stable: above 1 it grows forever and average waits only
+                                # depend on the number of interactions simulated)
+languages = ["en", "es"]
+intents = ["sales", "support"]
+
+
+def create_agents(random):
+    agents = Agents()
+    agents.load_agents([
+        {"agent id": i, "name": "Agent {}".format(i), "capacity": chats_per_agent,
+         "en": float(random.choice([0.0, 0.5, 1.0])), "es": float(random.choice([0.0, 0.5, 1.0])),
+         "sales": float(random.choice([0.0, 0.5, 1.0])), "support": float(random.choice([0.0, 0.5, 1.0]))}
+        for i in range(number_of_agents)])
+    return agents
+
+
+def simulate(number_of_interactions, sentiment_weight, seed=0):
+    """ Runs the simulation. Returns (wall clock seconds, waits, sentiments, maximum queue length).
+    """
+    random = np.random.RandomState(seed)
+    agents = create_agents(random)
+    now = [0.0]
+    queue = RoutingQueue(agents, sentiment_weight, clock=lambda: now[0])
+
+    events = []     # (time, sequence, kind, value)
+    sequence = [0]
+
+    def schedule(event_time, kind, value):
+        sequence[0] += 1
+        heapq.heappush(events, (event_time, sequence[0], kind, value))
+
+    waits = []
+    sentiments = []
+
+    def on_assigned(interaction, agent_id):
+        waits.append(now[0] - interaction.arrival_time)
+        sentiments.append(interaction.sentiment)
+        schedule(now[0] + random.exponential(mean_chat_duration), "end", agent_id)
+
+    agents.states.add_listener(lambda agent_id: queue.assign(agent_id, on_assigned))
+
+    arrival_rate = load * number_of_agents * chats_per_agent / mean_chat_duration
+    arrival_times = np.cumsum(random.exponential(1.0 / arrival_rate, number_of_interactions))
+    for i in range(number_of_interactions):
+        schedule(arrival_times[i], "arrival", i)
+
+    skill_index = agents.skill_index
+    max_queue_length = 0
+    start = time.perf_counter()
+
+    while len(events) > 0:
+        now[0], _, kind, value = heapq.heappop(events)
+        if kind == "end":
+            # The agent gets the next waiting interaction, if any (see the listener above)
+            agents.states.end_chat(value)
+            continue
+
+        language = languages[random.randint(len(languages))]
+        intent = intents[random.randint(len(intents))]
+        sentiment = float(random.rand())
+
+        # Same candidate generation as AIRouter.generate_candidates (without the ranking)
+        weights = skill_index.query_vector(language, intent)
+        rows = agents.states.get_available_rows([language, intent])
+        assigned = False
+        for agent_id, skill in skill_index.top_k_rows(weights, rows, 3):
+            if agents.states.start_chat(agent_id):
+                waits.append(0.0)
+                sentiments.append(sentiment)
+                schedule(now[0] + random.exponential(mean_chat_duration), "end", agent_id)
+                assigned = True
+                break
+        if not assigned:
+            queue.enqueue(value, language, sentiment, intent)
+            max_queue_length = max(max_queue_length, len(queue))
+
+    return time.perf_counter() - start, np.array(waits), np.array(sentiments), max_queue_length
+
+
+if __name__ == '__main__':
+    number_of_interactions = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print("{0} agents ({1} chats each), {2} interactions, load {3}".format(
+        number_of_agents, chats_per_agent, number_of_interactions, load))
+
+    for name, sentiment_weight in [("Order of arrival", 0.0), ("Priority to unhappy customers", 120.0)]:
+        seconds, waits, sentiments, max_queue_length = simulate(number_of_interactions, sentiment_weight)
+        unhappy = sentiments < 0.3
+        happy = sentiments > 0.7
+        print(name)
+        print("  {0:.0f} interactions routed per second ({1} assigned, queue up to {2})".format(
+            len(waits) / seconds, len(waits), max_queue_length))
+        print("  Average wait: {0:.1f}s (unhappy customers {1:.1f}s, happy customers {2:.1f}s)".format(
+            np.mean(waits), np.mean(waits[unhappy]), np.mean(waits[happy])))
@@ -0,0 +1,154 @@
+# -----------------------------------------------------
+# Benchmarks the construction of the training set of
+# the ranking network: the original per-row assembly
+# (build_baseline_sample, a copy of the code that
+# build_training_set replaced) versus the columnar
+# build_training_set. The baseline looks contacts and
+# agents up by id with the current CRM and Agents
+# indexes; the original scanned their lists, which
+# was slower still.
+# Uses a synthetic CRM; no API is called (the geocoding
+# cache is filled beforehand in a temporary file).
+#
+# Usage: python3 benchmark_training_set.py [history rows]
+# -----------------------------------------------------
+
+# Dependencies
+import os
+import sys
+import time
+import tempfile
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+import Geocoding
+from Geocoding import find_GPS_coordinates
+from CRM import CRM
+from Agents import Agents
+from FeatureStore import FeatureStore
+from RankingNetwork import RankingNetwork
+
+
+number_of_contacts = 100000
+number_of_agents = 1000
+number_of_postal_codes = 500
+number_of_rows_per_row_baseline = 20000
+
+
+def create_synthetic_data(number_of_rows, random):
+    crm = CRM()
+    crm.load_contacts([
+        {"contact id": i, "name": "Contact {}".format(i), "age": int(random.randint(18, 90)),
+         "postal code": "PC-{}".format(random.randint(number_of_postal_codes))}
+        for i in range(number_of_contacts)])
+
+    agents = Agents()
+    agents.load_agents([
+        {"agent id": i, "name": "Agent {}".format(i),
+         "en": float(random.rand()), "es": float(random.rand()),
+         "support": float(random.rand()), "sales": float(random.rand())}
+        for i in range(number_of_agents)])
+
+    languages = np.array(["en", "es", "fr"])
+    categories = np.array(["sales", "support", "other"])
+    history = {
+        "contact id": random.randint(number_of_contacts, size=number_of_rows),
+        "handled by": random.randint(number_of_agents, size=number_of_rows),
+        "language": languages[random.randint(len(languages), size=number_of_rows)],
+        "sentiment": random.rand(number_of_rows).astype(np.float32),
+        "category": categories[random.randint(len(categories), size=number_of_rows)],
+        "score": random.rand(number_of_rows).astype(np.float32)}
+
+    return crm, agents, history
+
+
+def fill_geocoding_cache(random):
+    Geocoding.geocoding_cache_file = os.path.join(tempfile.mkdtemp(), "geocoding_cache.db")
+    cache = Geocoding.get_geocoding_cache()
+    for i in range(number_of_postal_codes):
+        cache.set("PC-{}".format(i), [float(random.uniform(-90, 90)), float(random.uniform(-180, 180))])
+
+
+def build_language_embedding(language):
+    if language == "en":
+        return [0,1]
+    elif language == "es":
+        return [1,0]
+    else:
+        return [0,0]
+
+
+def build_category_embedding(category):
+    if category == "sales":
+        return [0,1]
+    elif category == "support":
+        return [1,0]
+    else:
+        return [0,0]
+
+
+def build_baseline_sample(crm, agents, contact_id, language, sentiment, category, agent_id):
+    """ Assembles one sample as RankingNetwork.build_input_sample did before the
+        feature store: Python lists built field by field for every row.
+    """
+    # contact info: id, age, GPS coordinates
+    contact = crm.get_contact_by_id(contact_id)
+    sample = [contact_id, contact["age"]]
+    if not "GPS" in contact:
+        # We get the GPS coordinates once per contact for performance reasons
+        found, contact["GPS"] = find_GPS_coordinates(contact["postal code"])
+    sample = sample + contact["GPS"]
+
+    # interaction info: language, sentiment, category
+    sample = sample + build_language_embedding(language)
+    sample.append(sentiment)
+    sample = sample + build_category_embedding(category)
+
+    # agent info: id, language skill (the one that matches the interaction language)
+    agent = agents.get_agent_by_id(agent_id)
+    if language=="en":
+        language_skill = agent["en"]
+    elif language=="es":
+        language_skill = agent["es"]
+    else:
+        language_skill = 0.0
+    sample += [agent_id, language_skill]
+
+    return sample
+
+
+if __name__ == '__main__':
+    number_of_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    random = np.random.RandomState(0)
+    fill_geocoding_cache(random)
+    crm, agents, history = create_synthetic_data(number_of_rows, random)
+
+    start = time.perf_counter()
+    features = FeatureStore(crm, agents, filename=None)
+    print("Feature store built in {:.2f} s".format(time.perf_counter() - start))
+
+    network = RankingNetwork(crm, agents, features=features)
+
+    # Baseline: one sample per row
+    rows = min(number_of_rows, number_of_rows_per_row_baseline)
+    start = time.perf_counter()
+    x = []
+    for i in range(rows):
+        x.append(build_baseline_sample(
+            crm, agents,
+            int(history["contact id"][i]),
+            history["language"][i],
+            float(history["sentiment"][i]),
+            history["category"][i],
+            int(history["handled by"][i])))
+    x = np.array(x)
+    seconds = time.perf_counter() - start
+    print("Row by row: {0} rows in {1:.2f} s ({2:,.0f} rows/s)".format(rows, seconds, rows / seconds))
+
+    # Columnar
+    start = time.perf_counter()
+    x_columnar, y = network.build_training_set(history)
+    seconds = time.perf_counter() - start
+    print("Columnar: {0} rows in {1:.2f} s ({2:,.0f} rows/s)".format(number_of_rows, seconds, number_of_rows / seconds))
+
+    if not np.allclose(x, x_columnar[:rows]):
+        print("Warning: the two training sets are different")
@@ -0,0 +1,63 @@
+# -----------------------------------------------------
+# Checks that the NumPy inference engine gives the same
+# predictions as the Keras model for the latest version
+# of the weights (weights.h5 or, after a training,
+# weights_vN.h5). Requires TensorFlow and Keras.
+#
+# Usage: python3 check_numpy_model.py
+# -----------------------------------------------------
+
+# Dependencies
+import sys
+import numpy as np      # Installation: pip3 install numpy==1.14.3
+from CRM import CRM
+from Agents import Agents
+from RankingNetwork import RankingNetwork
+from NumpyRankingModel import NumpyRankingModel
+
+
+tolerance = 1e-4
+
+crm = CRM()
+agents = Agents()
+
+# Both engines load the same file: the one the Keras network loaded
+keras_network = RankingNetwork(crm, agents, inference_only=False)
+version, weights_file = keras_network.registry.get_latest()
+print("Checking the weights in {}".format(weights_file))
+numpy_model = NumpyRankingModel.load(weights_file)
+
+# Random samples in the ranges of the real features, laid out as in
+# RankingNetwork.build_input_matrix (the sizes depend on the encoder configuration)
+random = np.random.RandomState(0)
+number_of_samples = 1000
+features = keras_network.features
+encoder = keras_network.encoder
+x = random.rand(number_of_samples, keras_network.input_size)
+
+# Contact: id, age, latitude, longitude
+column = features.contact_feature_size
+x[:, :column] *= [10, 90, 180, 360]
+x[:, :column] -= [0, 0, 90, 180]
+
+# Interaction: language (one-hot), sentiment, category (one-hot)
+x[:, column:column + encoder.languages.size] = np.eye(encoder.languages.size)[
+    random.randint(encoder.languages.size, size=number_of_samples)]
+column += encoder.languages.size + 1
+x[:, column:column + encoder.categories.size] = np.eye(encoder.categories.size)[
+    random.randint(encoder.categories.size, size=number_of_samples)]
+column += encoder.categories.size
+
+# Agent: id, language skill
+x[:, column] *= 10
+
+expected = keras_network.predict_batch(x)
+actual = numpy_model.predict(x)
+
+error = np.max(np.abs(expected - actual) / np.maximum(1.0, np.abs(expected)))
+print("Max relative difference between Keras and NumPy predictions: {}".format(error))
+
+if error > tolerance:
+    print("FAILED")
+    sys.exit(1)
+print("OK")
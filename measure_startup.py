@@ -0,0 +1,57 @@
+# -----------------------------------------------------
+# Measures the startup time of the bot.
+# Each measure runs in a fresh Python process, so module
+# imports are not cached between measures.
+#
+# Usage: python3 measure_startup.py [repetitions]
+# -----------------------------------------------------
+
+# Dependencies
+import sys
+import subprocess
+
+
+measures = [
+    ("Before: bot import + AIRouter with Keras (eager startup)",
+     "import AIRoutingBot\n"
+     "from AIRouter import AIRouter\n"
+     "AIRouter(AIRoutingBot.crm, AIRoutingBot.agents, inference_only=False)"),
+    ("Before: bot import + AIRouter with NumPy (eager startup)",
+     "import AIRoutingBot\n"
+     "AIRoutingBot.get_router()"),
+    ("After: bot import only (ready to serve greetings)",
+     "import AIRoutingBot"),
+]
+
+timer = """
+import time
+start = time.perf_counter()
+{}
+print(time.perf_counter() - start)
+"""
+
+
+def measure(code, repetitions):
+    """ Returns the best time (seconds) of running 'code' in a new process,
+        or None if the code fails (ex: TensorFlow not installed).
+    """
+    times = []
+    for i in range(repetitions):
+        result = subprocess.run([sys.executable, "-c", timer.format(code)],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        if result.returncode != 0:
+            return None
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return min(times)
+
+
+if __name__ == '__main__':
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    for name, code in measures:
+        seconds = measure(code, repetitions)
+        if seconds is None:
+            print("{0}: not available".format(name))
+        else:
+            print("{0}: {1:.3f} s".format(name, seconds))